@@ -0,0 +1,288 @@
+# api.py
+from counters import apply_task_changes, task_summary
+from deletion import restore_tasks, soft_delete_tasks
+from events import publish_task_event
+from extensions import db
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    g,
+    jsonify,
+    request,
+    stream_with_context,
+)
+from fragments import bump_task_list
+from models import Task
+from pagination import InvalidCursor, keyset_paginate, page_size
+from query_budget import query_budget
+from sqlalchemy import insert, update
+from transfer import (
+    FORMATS,
+    MIMETYPES,
+    TaskImportError,
+    detect_format,
+    export_tasks,
+    import_tasks,
+)
+from validation import TaskValidationError, parse_task_fields
+from werkzeug.exceptions import HTTPException
+
+api_v1 = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+
+@api_v1.before_request
+def require_login():
+    if g.get("user_id") is None:
+        return jsonify(error="Authentication required."), 401
+
+
+@api_v1.errorhandler(HTTPException)
+def json_error(exc):
+    return jsonify(error=exc.description), exc.code
+
+
+def _json_object() -> dict:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, description="Expected a JSON object.")
+    return data
+
+
+def _check_bulk_size(items: list) -> None:
+    limit = current_app.config["API_BULK_MAX"]
+    if len(items) > limit:
+        abort(413, description=f"At most {limit} items per bulk request.")
+
+
+def _ids(data: dict) -> list[int]:
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not all(
+        isinstance(i, int) and not isinstance(i, bool) for i in ids
+    ):
+        abort(400, description="'ids' must be a list of integers.")
+    _check_bulk_size(ids)
+    return ids
+
+
+def _own_task(task_id: int) -> Task:
+    return Task.query.filter_by(
+        id=task_id, user_id=g.user_id, deleted_at=None
+    ).first_or_404()
+
+
+@api_v1.get("/tasks")
+def list_tasks():
+    query = Task.query_for(g.user_id, request.args.get("status", "all"))
+    per_page = page_size(request.args.get("per_page", type=int))
+    try:
+        page = keyset_paginate(
+            query, Task.due_date, Task.id, request.args.get("cursor"), per_page
+        )
+    except InvalidCursor:
+        abort(400, description="Invalid cursor.")
+
+    return jsonify(
+        tasks=[task.to_dict() for task in page.items],
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor,
+    )
+
+
+@api_v1.get("/tasks/<int:task_id>")
+def get_task(task_id):
+    return jsonify(_own_task(task_id).to_dict())
+
+
+@api_v1.post("/tasks")
+def create_task():
+    data = _json_object()
+    try:
+        fields = parse_task_fields(
+            data.get("title"), data.get("description"), data.get("due_date")
+        )
+    except TaskValidationError as exc:
+        abort(400, description=str(exc))
+
+    task = Task(**fields, user_id=g.user_id)
+    db.session.add(task)
+    apply_task_changes(g.user_id, [(None, (False, task.due_date))])
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "created", task.id)
+    return jsonify(task.to_dict()), 201
+
+
+@api_v1.patch("/tasks/<int:task_id>")
+def update_task(task_id):
+    task = _own_task(task_id)
+    data = _json_object()
+
+    # Fields left out of the body keep their current value.
+    current = task.to_dict()
+    try:
+        fields = parse_task_fields(
+            data.get("title", current["title"]),
+            data.get("description", current["description"]),
+            data.get("due_date", current["due_date"]),
+        )
+    except TaskValidationError as exc:
+        abort(400, description=str(exc))
+
+    is_completed = data.get("is_completed", task.is_completed)
+    if not isinstance(is_completed, bool):
+        abort(400, description="is_completed must be a boolean.")
+
+    before = (task.is_completed, task.due_date)
+    for name, value in fields.items():
+        setattr(task, name, value)
+    task.is_completed = is_completed
+    apply_task_changes(g.user_id, [(before, (task.is_completed, task.due_date))])
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "updated", task_id)
+    return jsonify(task.to_dict())
+
+
+@api_v1.delete("/tasks/<int:task_id>")
+def delete_task(task_id):
+    if not soft_delete_tasks(g.user_id, [task_id]):
+        abort(404)
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "deleted", task_id)
+    return "", 204
+
+
+@api_v1.post("/tasks/<int:task_id>/restore")
+def restore_task(task_id):
+    if not restore_tasks(g.user_id, [task_id]):
+        abort(404, description="No deleted task with this id.")
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "restored", task_id)
+    return jsonify(_own_task(task_id).to_dict())
+
+
+@api_v1.post("/tasks/bulk")
+# Capped by API_BULK_MAX. Ordered RETURNING is one INSERT per row on SQLite.
+@query_budget(None)
+def bulk_create_tasks():
+    items = _json_object().get("tasks")
+    if not isinstance(items, list):
+        abort(400, description="'tasks' must be a list.")
+    _check_bulk_size(items)
+
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Expected a JSON object."})
+            continue
+        try:
+            fields = parse_task_fields(
+                item.get("title"), item.get("description"), item.get("due_date")
+            )
+        except TaskValidationError as exc:
+            errors.append({"index": index, "error": str(exc)})
+            continue
+        rows.append({**fields, "user_id": g.user_id})
+
+    # All or nothing: one invalid row rejects the whole batch.
+    if errors:
+        return jsonify(errors=errors), 400
+
+    ids = []
+    if rows:
+        # Batched into multi-row INSERT ... VALUES statements by SQLAlchemy.
+        ids = db.session.scalars(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True), rows
+        ).all()
+        apply_task_changes(
+            g.user_id, [(None, (False, row["due_date"])) for row in rows]
+        )
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "reset")
+    return jsonify(ids=ids), 201
+
+
+@api_v1.post("/tasks/bulk-complete")
+def bulk_complete_tasks():
+    # Only open tasks match, so the returned ids are the ones this call completed.
+    ids = _ids(_json_object())
+    updated = db.session.execute(
+        update(Task)
+        .where(
+            Task.user_id == g.user_id,
+            Task.id.in_(ids),
+            Task.deleted_at.is_(None),
+            ~Task.is_completed,
+        )
+        .values(is_completed=True)
+        .returning(Task.id, Task.due_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+    apply_task_changes(
+        g.user_id, [((False, due_date), (True, due_date)) for _, due_date in updated]
+    )
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "reset")
+    return jsonify(ids=sorted(task_id for task_id, _ in updated))
+
+
+@api_v1.post("/tasks/bulk-delete")
+def bulk_delete_tasks():
+    deleted = soft_delete_tasks(g.user_id, _ids(_json_object()))
+    db.session.commit()
+    bump_task_list(g.user_id)
+    publish_task_event(g.user_id, "reset")
+    return jsonify(ids=sorted(deleted))
+
+
+@api_v1.post("/tasks/import")
+@query_budget(None)  # a few statements per batch, however many batches
+def import_tasks_file():
+    # Either a multipart upload in "file" or the raw file as the request body.
+    upload = request.files.get("file")
+    try:
+        fmt = request.args.get("format") or detect_format(
+            upload.filename if upload else None, request.mimetype
+        )
+        result = import_tasks(
+            g.user_id,
+            upload.stream if upload else request.stream,
+            fmt,
+            batch_size=current_app.config["IMPORT_BATCH_SIZE"],
+            max_rows=current_app.config["IMPORT_MAX_ROWS"],
+        )
+    except TaskImportError as exc:
+        abort(400, description=str(exc))
+
+    if result.imported:
+        bump_task_list(g.user_id)
+        publish_task_event(g.user_id, "reset")
+    return jsonify(
+        imported=result.imported, error_count=result.error_count, errors=result.errors
+    )
+
+
+@api_v1.get("/tasks/export")
+def export_tasks_file():
+    fmt = request.args.get("format", "jsonl")
+    if fmt not in FORMATS:
+        abort(400, description="format must be csv or jsonl.")
+    chunks = export_tasks(
+        g.user_id, fmt, request.args.get("status", "all"), batch_size=1000
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype=MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=tasks.{fmt}"},
+    )
+
+
+@api_v1.get("/summary")
+def summary():
+    return jsonify(task_summary(g.user_id))
@@ -1,20 +1,50 @@
 import os
-from datetime import date, datetime
 from functools import wraps
 
+from api import api_v1
+from async_db import init_async_db
+from commands import register_commands
+from conditional import (
+    add_validators,
+    not_modified,
+    pop_once,
+    task_list_etag,
+    task_list_stamp,
+    task_list_version,
+    task_validators,
+)
+from counters import apply_task_changes, task_summary
+from deletion import restore_tasks, soft_delete_tasks
 from dotenv import load_dotenv
-from extensions import db
+from events import init_events, publish_task_event
+from extensions import db, migrate
 from flask import (
     Flask,
+    abort,
     flash,
     g,
+    make_response,
     redirect,
     render_template,
     request,
     session,
     url_for,
 )
-from models import Task, User
+from fragments import bump_task_list, cached_task_list, init_fragment_cache
+from hashing import HashingBusy, hash_password, init_hashing, verify_password
+from identity import current_user, init_user_cache, invalidate_user
+from metrics import InstrumentedQueuePool, init_metrics
+from models import Task, TaskCounter, User, request_today
+from pagination import InvalidCursor, keyset_paginate, page_size
+from query_budget import init_query_budget, parse_budgets
+from ratelimit import check_rate_limit, init_rate_limits
+from replicas import init_replicas, replica_configs
+from search import normalize_query, search_tasks
+from sessions import init_sessions
+from sqlalchemy import update
+from sqlalchemy.engine import make_url
+from validation import TaskValidationError, parse_task_fields
+from werkzeug.local import LocalProxy
 
 load_dotenv()
 
@@ -32,20 +62,167 @@ def _build_postgres_uri() -> str:
     return f"postgresql://{user}:{password}@{host}:{port}/{name}"
 
 
+def _build_engine_options(uri: str) -> dict:
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite runs on a single static connection: nothing to tune.
+        return {}
+
+    options = {"poolclass": InstrumentedQueuePool}
+    env_options = {
+        "pool_size": ("DB_POOL_SIZE", int),
+        "max_overflow": ("DB_MAX_OVERFLOW", int),
+        "pool_recycle": ("DB_POOL_RECYCLE", int),
+        "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    }
+    for option, (var, cast) in env_options.items():
+        value = os.environ.get(var)
+        if value:
+            options[option] = cast(value)
+
+    pre_ping = os.environ.get("DB_POOL_PRE_PING")
+    if pre_ping:
+        options["pool_pre_ping"] = pre_ping.lower() in ("1", "true", "yes", "on")
+
+    statement_timeout = os.environ.get("DB_STATEMENT_TIMEOUT")
+    if statement_timeout and url.get_backend_name() == "postgresql":
+        # Milliseconds, applied server-side to every statement on the connection.
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={int(statement_timeout)}"
+        }
+
+    return options
+
+
 def create_app():
     app = Flask(__name__)
 
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev-unsafe-secret")
     app.config["SQLALCHEMY_DATABASE_URI"] = _build_postgres_uri()
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _build_engine_options(
+        app.config["SQLALCHEMY_DATABASE_URI"]
+    )
+    app.config["DATABASE_REPLICAS"] = replica_configs(
+        [
+            url.strip()
+            for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",")
+            if url.strip()
+        ],
+        _build_engine_options,
+    )
+    app.config["REPLICA_STICKY_SECONDS"] = float(
+        os.environ.get("REPLICA_STICKY_SECONDS", "5")
+    )
+    app.config["REPLICA_RETRY_SECONDS"] = float(
+        os.environ.get("REPLICA_RETRY_SECONDS", "30")
+    )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
+    app.config["TASKS_PER_PAGE"] = int(os.environ.get("TASKS_PER_PAGE", "50"))
+    app.config["TASKS_MAX_PER_PAGE"] = int(os.environ.get("TASKS_MAX_PER_PAGE", "200"))
+    app.config["API_BULK_MAX"] = int(os.environ.get("API_BULK_MAX", "5000"))
+    app.config["IMPORT_BATCH_SIZE"] = int(os.environ.get("IMPORT_BATCH_SIZE", "1000"))
+    app.config["IMPORT_MAX_ROWS"] = int(os.environ.get("IMPORT_MAX_ROWS", "100000"))
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get(
+        "PASSWORD_HASH_METHOD", "scrypt"
+    )
+    app.config["PASSWORD_SALT_LENGTH"] = int(
+        os.environ.get("PASSWORD_SALT_LENGTH", "16")
+    )
+    app.config["PASSWORD_HASH_EXECUTOR"] = os.environ.get(
+        "PASSWORD_HASH_EXECUTOR", "thread"
+    )
+    app.config["PASSWORD_HASH_WORKERS"] = int(
+        os.environ.get("PASSWORD_HASH_WORKERS", "2")
+    )
+    app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", "16"))
+    app.config["RATE_LIMIT_BACKEND"] = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    app.config["RATE_LIMIT_PER_IP"] = os.environ.get("RATE_LIMIT_PER_IP", "20/60")
+    app.config["RATE_LIMIT_PER_USERNAME"] = os.environ.get(
+        "RATE_LIMIT_PER_USERNAME", "10/300"
+    )
+    app.config["RATE_LIMIT_MEMORY_SIZE"] = int(
+        os.environ.get("RATE_LIMIT_MEMORY_SIZE", "100000")
+    )
+    app.config["CACHE_BACKEND"] = os.environ.get("CACHE_BACKEND", "memory")
+    app.config["CACHE_REDIS_URL"] = os.environ.get(
+        "CACHE_REDIS_URL", "redis://localhost:6379/0"
+    )
+    app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", "300"))
+    app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+    app.config["METRICS_ENABLED"] = os.environ.get(
+        "METRICS_ENABLED", "1"
+    ).lower() in ("1", "true", "yes", "on")
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", "200"))
+    app.config["QUERY_BUDGET_MODE"] = os.environ.get("QUERY_BUDGET_MODE", "warn")
+    app.config["QUERY_BUDGET_DEFAULT"] = (
+        int(os.environ.get("QUERY_BUDGET_DEFAULT", "20")) or None
+    )
+    app.config["QUERY_BUDGETS"] = parse_budgets(os.environ.get("QUERY_BUDGETS", ""))
+    app.config["QUERY_REPEAT_LIMIT"] = int(os.environ.get("QUERY_REPEAT_LIMIT", "5"))
+    app.config["ASYNC_DB"] = os.environ.get(
+        "ASYNC_DB", "0"
+    ).lower() in ("1", "true", "yes", "on")
+    app.config["DELETED_TASK_TTL"] = float(
+        os.environ.get("DELETED_TASK_TTL", "86400")
+    )
+    app.config["JOB_CONCURRENCY"] = int(os.environ.get("JOB_CONCURRENCY", "4"))
+    app.config["JOB_MAX_ATTEMPTS"] = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+    app.config["JOB_RETRY_BACKOFF"] = float(os.environ.get("JOB_RETRY_BACKOFF", "30"))
+    app.config["JOB_RETRY_MAX_DELAY"] = float(
+        os.environ.get("JOB_RETRY_MAX_DELAY", "3600")
+    )
+    app.config["JOB_LOCK_TIMEOUT"] = float(os.environ.get("JOB_LOCK_TIMEOUT", "900"))
+    app.config["JOB_RETENTION"] = float(os.environ.get("JOB_RETENTION", "604800"))
+    app.config["JOB_PURGE_INTERVAL"] = float(
+        os.environ.get("JOB_PURGE_INTERVAL", "3600")
+    )
+    app.config["TASK_DIGEST_HOUR"] = int(os.environ.get("TASK_DIGEST_HOUR", "7"))
+    app.config["DIGEST_BATCH_SIZE"] = int(os.environ.get("DIGEST_BATCH_SIZE", "1000"))
+    app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "cookie")
+    app.config["SESSION_CACHE_SIZE"] = int(
+        os.environ.get("SESSION_CACHE_SIZE", "100000")
+    )
+    app.config["FRAGMENT_CACHE_ENABLED"] = os.environ.get(
+        "FRAGMENT_CACHE_ENABLED", "1"
+    ).lower() in ("1", "true", "yes", "on")
+    app.config["FRAGMENT_CACHE_TTL"] = float(
+        os.environ.get("FRAGMENT_CACHE_TTL", "60")
+    )
+    app.config["FRAGMENT_CACHE_SIZE"] = int(
+        os.environ.get("FRAGMENT_CACHE_SIZE", "5000")
+    )
+    app.config["EVENTS_BACKEND"] = os.environ.get("EVENTS_BACKEND", "off")
+    app.config["EVENTS_SYNC_STREAMS"] = os.environ.get(
+        "EVENTS_SYNC_STREAMS", "0"
+    ).lower() in ("1", "true", "yes", "on")
+    app.config["EVENTS_HEARTBEAT"] = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+    app.config["EVENTS_STREAM_SECONDS"] = float(
+        os.environ.get("EVENTS_STREAM_SECONDS", "300")
+    )
+    app.config["EVENTS_RETRY_MS"] = int(os.environ.get("EVENTS_RETRY_MS", "3000"))
+    app.config["EVENTS_QUEUE_SIZE"] = int(os.environ.get("EVENTS_QUEUE_SIZE", "100"))
+
+    # No database I/O while building the app: engines connect lazily and the
+    # schema is managed by `flask db upgrade` (or migrate.py), run once per
+    # deploy instead of once per worker.
     db.init_app(app)
-
-    with app.app_context():
-        # from models import User, Task noqa: F401
-        db.create_all()
+    migrate.init_app(
+        app, db, directory=os.path.join(os.path.dirname(__file__), "migrations")
+    )
+    init_user_cache(app)
+    init_sessions(app)
+    init_hashing(app)
+    init_rate_limits(app)
+    init_fragment_cache(app)
+    init_metrics(app)
+    init_query_budget(app)
+    init_replicas(app)
+    init_async_db(app)
+    init_events(app)
 
     register_routes(app)
+    register_commands(app)
+    app.register_blueprint(api_v1)
     return app
 
 
@@ -60,35 +237,92 @@ def login_required(view):
     return wrapped_view
 
 
+def _is_fetch() -> bool:
+    # Set by static/task_events.js, which updates the page from the event
+    # stream instead of following a redirect.
+    return request.headers.get("X-Requested-With") == "fetch"
+
+
 def register_routes(app):
     # from models import User, Task
 
     @app.before_request
     def load_logged_in_user():
-        user_id = session.get("user_id")
-        if user_id is None:
-            g.user = None
-        else:
-            g.user = User.query.get(user_id)
+        # Views that only need the id read g.user_id; g.user is looked up
+        # (through the user cache) the first time something touches it.
+        g.user_id = session.get("user_id")
+        g.user = LocalProxy(current_user)
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(exc):
+        message = "Too many sign-ins in progress, retry shortly."
+        return message, 503, {"Retry-After": "1"}
 
     @app.route("/")
     @login_required
     def index():
         status_filter = request.args.get("status", "all")
-        query = Task.query.filter_by(user_id=g.user.id)
-
-        if status_filter == "open":
-            query = query.filter_by(is_completed=False)
-        elif status_filter == "done":
-            query = query.filter_by(is_completed=True)
-
-        tasks = query.order_by(Task.due_date.asc().nullslast()).all()
-        return render_template(
-            "index.html",
-            tasks=tasks,
-            status_filter=status_filter,
-            today=date.today(),
+        per_page = page_size(request.args.get("per_page", type=int))
+        cursor = request.args.get("cursor") or None
+        q = normalize_query(request.args.get("q"))
+        today = request_today()
+
+        # Answer revalidations from one aggregate, before any row is loaded.
+        key_parts = (
+            status_filter,
+            cursor,
+            request.args.get("per_page"),
+            q,
+            today.isoformat(),
+        )
+        stamp = db.session.execute(task_list_stamp(g.user_id)).one()
+        etag, last_modified = task_list_etag(g.user_id, stamp, key_parts)
+        unchanged = not_modified(etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+
+        def render_task_list():
+            query = Task.query_for(g.user_id, status_filter, today)
+            try:
+                if q:
+                    page = search_tasks(query, q, cursor, per_page)
+                else:
+                    page = keyset_paginate(
+                        query, Task.due_date, Task.id, cursor, per_page
+                    )
+            except InvalidCursor:
+                abort(400)
+
+            return render_template(
+                "_task_list.html",
+                tasks=page.items,
+                next_cursor=page.next_cursor,
+                prev_cursor=page.prev_cursor,
+                per_page=request.args.get("per_page", type=int),
+                status_filter=status_filter,
+                q=q,
+                today=today,
+            )
+
+        # Overdue badges depend on the date, so it is part of the key. So is
+        # the stamp: a change made through another worker, whose bump this
+        # worker's in-memory cache hasn't seen, must not serve an old list
+        # under the new ETag.
+        task_list_html = cached_task_list(
+            g.user_id, (*key_parts, *stamp), render_task_list
+        )
+        response = make_response(
+            render_template(
+                "index.html",
+                task_list_html=task_list_html,
+                status_filter=status_filter,
+                q=q,
+                summary=task_summary(g.user_id),
+                undo_task_id=pop_once("undo_task_id"),
+                list_version=task_list_version(g.user_id, stamp),
+            )
         )
+        return add_validators(response, etag, last_modified)
 
     @app.route("/register", methods=["GET", "POST"])
     def register():
@@ -96,6 +330,7 @@ def register_routes(app):
             username = request.form.get("username", "").strip()
             password = request.form.get("password", "")
             confirm = request.form.get("confirm", "")
+            check_rate_limit("register", username)
 
             if not username or not password:
                 flash("Username and password are required.", "error")
@@ -104,9 +339,10 @@ def register_routes(app):
             elif User.query.filter_by(username=username).first():
                 flash("Username is already taken.", "error")
             else:
-                user = User(username=username)
-                user.set_password(password)
+                user = User(username=username, password_hash=hash_password(password))
                 db.session.add(user)
+                db.session.flush()
+                db.session.add(TaskCounter(user_id=user.id))
                 db.session.commit()
                 flash("Registration successful. Please log in.", "success")
                 return redirect(url_for("login"))
@@ -118,11 +354,19 @@ def register_routes(app):
         if request.method == "POST":
             username = request.form.get("username", "").strip()
             password = request.form.get("password", "")
+            check_rate_limit("login", username)
 
             user = User.query.filter_by(username=username).first()
-            if user is None or not user.check_password(password):
+            if user is None or not verify_password(user.password_hash, password):
                 flash("Invalid username or password.", "error")
             else:
+                # The password is known to be right: upgrade an outdated hash.
+                if user.needs_rehash(
+                    app.config["PASSWORD_HASH_METHOD"],
+                    app.config["PASSWORD_SALT_LENGTH"],
+                ):
+                    user.password_hash = hash_password(password)
+                    db.session.commit()
                 session.clear()
                 session["user_id"] = user.id
                 flash("Logged in successfully.", "success")
@@ -134,6 +378,7 @@ def register_routes(app):
     @app.route("/logout")
     @login_required
     def logout():
+        invalidate_user(g.user_id)
         session.clear()
         flash("You have been logged out.", "success")
         return redirect(url_for("login"))
@@ -142,30 +387,22 @@ def register_routes(app):
     @login_required
     def create_task():
         if request.method == "POST":
-            title = request.form.get("title", "").strip()
-            description = request.form.get("description", "").strip()
-            due_date_str = request.form.get("due_date", "").strip()
-
-            if not title:
-                flash("Title is required.", "error")
+            try:
+                fields = parse_task_fields(
+                    request.form.get("title"),
+                    request.form.get("description"),
+                    request.form.get("due_date"),
+                )
+            except TaskValidationError as exc:
+                flash(str(exc), "error")
                 return render_template("task_form.html", task=None)
 
-            due_date = None
-            if due_date_str:
-                try:
-                    due_date = datetime.strptime(due_date_str, "%Y-%m-%d").date()
-                except ValueError:
-                    flash("Invalid date format. Use YYYY-MM-DD.", "error")
-                    return render_template("task_form.html", task=None)
-
-            task = Task(
-                title=title,
-                description=description or None,
-                due_date=due_date,
-                user_id=g.user.id,
-            )
+            task = Task(**fields, user_id=g.user_id)
             db.session.add(task)
+            apply_task_changes(g.user_id, [(None, (False, task.due_date))])
             db.session.commit()
+            bump_task_list(g.user_id)
+            publish_task_event(g.user_id, "created", task.id)
             flash("Task created.", "success")
             return redirect(url_for("index"))
 
@@ -174,56 +411,106 @@ def register_routes(app):
     @app.route("/tasks/<int:task_id>/edit", methods=["GET", "POST"])
     @login_required
     def edit_task(task_id):
-        task = Task.query.filter_by(id=task_id, user_id=g.user.id).first_or_404()
+        if request.method == "GET":
+            etag, last_modified = task_validators(g.user_id, task_id)
+            unchanged = not_modified(etag, last_modified)
+            if unchanged is not None:
+                return unchanged
 
-        if request.method == "POST":
-            title = request.form.get("title", "").strip()
-            description = request.form.get("description", "").strip()
-            due_date_str = request.form.get("due_date", "").strip()
-            is_completed = bool(request.form.get("is_completed"))
+        task = Task.query.filter_by(
+            id=task_id, user_id=g.user_id, deleted_at=None
+        ).first_or_404()
 
-            if not title:
-                flash("Title is required.", "error")
+        if request.method == "POST":
+            try:
+                fields = parse_task_fields(
+                    request.form.get("title"),
+                    request.form.get("description"),
+                    request.form.get("due_date"),
+                )
+            except TaskValidationError as exc:
+                flash(str(exc), "error")
                 return render_template("task_form.html", task=task)
 
-            due_date = None
-            if due_date_str:
-                try:
-                    due_date = datetime.strptime(due_date_str, "%Y-%m-%d").date()
-                except ValueError:
-                    flash("Invalid date format. Use YYYY-MM-DD.", "error")
-                    return render_template("task_form.html", task=task)
-
-            task.title = title
-            task.description = description or None
-            task.due_date = due_date
-            task.is_completed = is_completed
+            before = (task.is_completed, task.due_date)
+            for name, value in fields.items():
+                setattr(task, name, value)
+            task.is_completed = bool(request.form.get("is_completed"))
+            apply_task_changes(
+                g.user_id, [(before, (task.is_completed, task.due_date))]
+            )
             db.session.commit()
+            bump_task_list(g.user_id)
+            publish_task_event(g.user_id, "updated", task_id)
 
             flash("Task updated.", "success")
             return redirect(url_for("index"))
 
-        return render_template("task_form.html", task=task)
+        response = make_response(render_template("task_form.html", task=task))
+        return add_validators(response, etag, last_modified)
 
     @app.route("/tasks/<int:task_id>/toggle", methods=["POST"])
     @login_required
     def toggle_task(task_id):
-        task = Task.query.filter_by(id=task_id, user_id=g.user.id).first_or_404()
-        task.is_completed = not task.is_completed
+        # A single UPDATE ... RETURNING: no SELECT round trip beforehand, and
+        # two concurrent toggles can't both read the same old value.
+        toggled = db.session.execute(
+            update(Task)
+            .where(
+                Task.id == task_id,
+                Task.user_id == g.user_id,
+                Task.deleted_at.is_(None),
+            )
+            .values(is_completed=~Task.is_completed)
+            .returning(Task.is_completed, Task.due_date)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if toggled is None:
+            abort(404)
+        is_completed, due_date = toggled
+        apply_task_changes(
+            g.user_id, [((not is_completed, due_date), (is_completed, due_date))]
+        )
         db.session.commit()
+        bump_task_list(g.user_id)
+        publish_task_event(g.user_id, "updated", task_id)
+        if _is_fetch():
+            return "", 204
         flash("Task status updated.", "success")
         return redirect(url_for("index"))
 
     @app.route("/tasks/<int:task_id>/delete", methods=["POST"])
     @login_required
     def delete_task(task_id):
-        task = Task.query.filter_by(id=task_id, user_id=g.user.id).first_or_404()
-        db.session.delete(task)
+        # A soft delete: the row stays until `flask tasks purge` removes it,
+        # so the task list can offer an undo.
+        if not soft_delete_tasks(g.user_id, [task_id]):
+            abort(404)
         db.session.commit()
+        bump_task_list(g.user_id)
+        publish_task_event(g.user_id, "deleted", task_id)
+        if _is_fetch():
+            # The page offers the undo itself.
+            return "", 204
+        session["undo_task_id"] = task_id
         flash("Task deleted.", "success")
         return redirect(url_for("index"))
 
+    @app.route("/tasks/<int:task_id>/restore", methods=["POST"])
+    @login_required
+    def restore_task(task_id):
+        if not restore_tasks(g.user_id, [task_id]):
+            abort(404)
+        db.session.commit()
+        bump_task_list(g.user_id)
+        publish_task_event(g.user_id, "restored", task_id)
+        if _is_fetch():
+            return "", 204
+        flash("Task restored.", "success")
+        return redirect(url_for("index"))
+
 
 if __name__ == "__main__":
+    # Local development server only; production runs wsgi:app under gunicorn.
     app = create_app()
-    app.run(debug=True, port=5001, host="0.0.0.0")
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", port=5001, host="0.0.0.0")
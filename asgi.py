@@ -0,0 +1,20 @@
+# asgi.py
+#
+# ASGI entry point with the read-heavy pages and JSON endpoints served by
+# async views on the async engine (see async_views.py):
+#
+#     uvicorn asgi:app --workers 4
+#
+# Needs requirements-asgi.txt: asgiref, greenlet, aiosqlite (SQLite) or
+# asyncpg (PostgreSQL) and uvicorn; the Dockerfile installs it with
+# --build-arg REQUIREMENTS=requirements-asgi.txt. wsgi:app under gunicorn
+# stays the default setup. Event streams (/events) wait on the event loop
+# here instead of holding a thread.
+import os
+
+from app import create_app
+from async_views import AsyncApp
+
+os.environ.setdefault("ASYNC_DB", "1")
+
+app = AsyncApp(create_app())
@@ -0,0 +1,126 @@
+# async_db.py
+import asyncio
+from datetime import date
+
+from conditional import task_etag, task_list_stamp, task_stamp
+from counters import counter_summary, task_summary
+from extensions import db
+from flask import current_app
+from metrics import instrument_engine
+from models import Task, TaskCounter, request_today
+from pagination import keyset_page, keyset_window
+from query_budget import watch_engine
+from sqlalchemy import select
+
+# Sync driver -> asyncio driver of the same database.
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_url(url):
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"ASYNC_DB doesn't support {backend!r} databases")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def _engine_options(app) -> dict:
+    # The sync engine's pool settings, minus what only applies to it.
+    options = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+    options.pop("poolclass", None)
+    connect_args = options.pop("connect_args", {})
+    if "options" in connect_args:
+        # psycopg2's "-c statement_timeout=..." is a server setting for asyncpg.
+        setting = connect_args["options"].removeprefix("-c ").split("=", 1)
+        options["connect_args"] = {"server_settings": dict([setting])}
+    return options
+
+
+def init_async_db(app) -> None:
+    """
+    Create the async engine used by the ASGI entry point (asgi.py) when
+    ASYNC_DB is on. Like the sync engine, it connects on first use only.
+    """
+    if not app.config["ASYNC_DB"]:
+        return
+    with app.app_context():
+        # The database of the sync engine, whatever the config says by now.
+        url = async_url(db.engine.url)
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        engine = create_async_engine(url, **_engine_options(app))
+    except ImportError as exc:
+        raise RuntimeError(
+            "ASYNC_DB requires 'greenlet' and the 'aiosqlite' (SQLite) or "
+            "'asyncpg' (PostgreSQL) package"
+        ) from exc
+
+    # Events of an async engine fire on its sync_engine, inside the request.
+    instrument_engine(app, engine.sync_engine)
+    watch_engine(engine.sync_engine)
+    app.extensions["async_engine"] = engine
+    app.extensions["async_sessionmaker"] = async_sessionmaker(
+        engine, expire_on_commit=False
+    )
+
+
+def async_session():
+    """
+    A new AsyncSession; use it as `async with async_session() as session:`.
+    """
+    return current_app.extensions["async_sessionmaker"]()
+
+
+async def fetch_task_list_stamp(user_id: int):
+    async with async_session() as session:
+        return (await session.execute(task_list_stamp(user_id))).one()
+
+
+async def fetch_task_validators(user_id: int, task_id: int):
+    async with async_session() as session:
+        last_modified = await session.scalar(task_stamp(user_id, task_id))
+    return task_etag(user_id, task_id, last_modified)
+
+
+async def fetch_task_page(
+    user_id: int,
+    status_filter: str,
+    cursor: str | None,
+    per_page: int,
+    today: date | None = None,
+):
+    """
+    keyset_paginate() of the user's task list. Raises InvalidCursor.
+    """
+    stmt, direction = keyset_window(
+        select(Task).where(*Task.list_filter(user_id, status_filter, today)),
+        Task.due_date,
+        Task.id,
+        cursor,
+        per_page,
+    )
+    async with async_session() as session:
+        rows = list(await session.scalars(stmt))
+    return keyset_page(rows, Task.due_date, Task.id, cursor, direction, per_page)
+
+
+async def fetch_task(user_id: int, task_id: int) -> Task | None:
+    async with async_session() as session:
+        return await session.scalar(
+            select(Task).where(
+                Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None)
+            )
+        )
+
+
+async def fetch_task_summary(user_id: int) -> dict:
+    """
+    task_summary() from the counters row. The once-a-day overdue recount
+    (and creating missing counters) writes, so it runs the sync version in a
+    thread instead.
+    """
+    async with async_session() as session:
+        counter = await session.get(TaskCounter, user_id)
+    if counter is None or counter.overdue_as_of != request_today():
+        return await asyncio.to_thread(task_summary, user_id)
+    return counter_summary(counter)
@@ -0,0 +1,330 @@
+# async_views.py
+import asyncio
+import inspect
+import io
+import sys
+from urllib.parse import parse_qs
+
+from app import login_required
+from async_db import (
+    fetch_task,
+    fetch_task_list_stamp,
+    fetch_task_page,
+    fetch_task_summary,
+    fetch_task_validators,
+)
+from conditional import (
+    add_validators,
+    not_modified,
+    pop_once,
+    task_list_etag,
+    task_list_version,
+)
+from events import STREAM_HEADERS, AsyncSubscription, async_stream
+from flask import (
+    Response,
+    abort,
+    current_app,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+)
+from flask.globals import request_ctx
+from fragments import cached_task_list_async
+from models import request_today
+from pagination import InvalidCursor, page_size
+from search import normalize_query
+from werkzeug.exceptions import HTTPException
+
+# Sessions these backends keep are read and written without I/O; any other
+# backend is opened and saved in a thread, off the event loop.
+INLINE_SESSION_BACKENDS = ("cookie", "memory")
+
+
+@login_required
+async def index():
+    status_filter = request.args.get("status", "all")
+    per_page = page_size(request.args.get("per_page", type=int))
+    cursor = request.args.get("cursor") or None
+    today = request_today()
+    # Same ETag and fragment key as the sync view with an empty search.
+    key_parts = (
+        status_filter,
+        cursor,
+        request.args.get("per_page"),
+        "",
+        today.isoformat(),
+    )
+
+    stamp = await fetch_task_list_stamp(g.user_id)
+    etag, last_modified = task_list_etag(g.user_id, stamp, key_parts)
+    unchanged = not_modified(etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    async def render_task_list():
+        try:
+            page = await fetch_task_page(
+                g.user_id, status_filter, cursor, per_page, today
+            )
+        except InvalidCursor:
+            abort(400)
+        return render_template(
+            "_task_list.html",
+            tasks=page.items,
+            next_cursor=page.next_cursor,
+            prev_cursor=page.prev_cursor,
+            per_page=request.args.get("per_page", type=int),
+            status_filter=status_filter,
+            q="",
+            today=today,
+        )
+
+    # The list and the counters are independent: fetch them concurrently.
+    task_list_html, summary = await asyncio.gather(
+        cached_task_list_async(g.user_id, (*key_parts, *stamp), render_task_list),
+        fetch_task_summary(g.user_id),
+    )
+    response = make_response(
+        render_template(
+            "index.html",
+            task_list_html=task_list_html,
+            status_filter=status_filter,
+            q="",
+            summary=summary,
+            undo_task_id=pop_once("undo_task_id"),
+            list_version=task_list_version(g.user_id, stamp),
+        )
+    )
+    return add_validators(response, etag, last_modified)
+
+
+@login_required
+async def edit_task(task_id):
+    etag, last_modified = await fetch_task_validators(g.user_id, task_id)
+    unchanged = not_modified(etag, last_modified)
+    if unchanged is not None:
+        return unchanged
+
+    task = await fetch_task(g.user_id, task_id)
+    if task is None:
+        abort(404)
+    response = make_response(render_template("task_form.html", task=task))
+    return add_validators(response, etag, last_modified)
+
+
+async def list_tasks():
+    per_page = page_size(request.args.get("per_page", type=int))
+    try:
+        page = await fetch_task_page(
+            g.user_id,
+            request.args.get("status", "all"),
+            request.args.get("cursor"),
+            per_page,
+        )
+    except InvalidCursor:
+        abort(400, description="Invalid cursor.")
+    return jsonify(
+        tasks=[task.to_dict() for task in page.items],
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor,
+    )
+
+
+async def get_task(task_id):
+    task = await fetch_task(g.user_id, task_id)
+    if task is None:
+        abort(404)
+    return jsonify(task.to_dict())
+
+
+async def summary():
+    return jsonify(await fetch_task_summary(g.user_id))
+
+
+async def task_events():
+    if g.get("user_id") is None:
+        abort(401)
+    app = current_app._get_current_object()
+    subscription = AsyncSubscription(g.user_id, app.config["EVENTS_QUEUE_SIZE"])
+    response = Response(mimetype="text/event-stream", headers=STREAM_HEADERS)
+    # Streamed by AsyncApp once the response went through the request hooks.
+    response.async_body = async_stream(app, request_ctx.copy(), subscription)
+    return response
+
+
+# GET endpoints served on the event loop; everything else goes to the WSGI app.
+ASYNC_VIEWS = {
+    "index": index,
+    "edit_task": edit_task,
+    "task_events": task_events,
+    "api_v1.list_tasks": list_tasks,
+    "api_v1.get_task": get_task,
+    "api_v1.summary": summary,
+}
+
+
+def _environ(scope) -> dict:
+    """
+    The WSGI environ of a bodyless ASGI HTTP request.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _headers(headers) -> list:
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+
+def _body(chunk: bytes, more_body: bool = False) -> dict:
+    return {"type": "http.response.body", "body": chunk, "more_body": more_body}
+
+
+class AsyncApp:
+    """
+    ASGI application serving ASYNC_VIEWS with asyncio and the async engine,
+    and handing any other request to the Flask app through asgiref.
+
+    Async views run inside a regular Flask request context: before_request
+    and after_request hooks, sessions, flash messages, templates and error
+    handlers behave exactly as in the WSGI app.
+    """
+
+    def __init__(self, app):
+        if "async_engine" not in app.extensions:
+            raise RuntimeError("The ASGI app requires ASYNC_DB=1")
+        from asgiref.wsgi import WsgiToAsgi
+
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        # Tells task_events_url() that event streams are served.
+        app.extensions["asgi"] = self
+        self.inline_session = app.config["SESSION_BACKEND"] in INLINE_SESSION_BACKENDS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        view, environ = None, None
+        if scope["type"] == "http" and scope["method"] == "GET":
+            environ = _environ(scope)
+            view = self._match(environ)
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+
+        response = await self._dispatch(environ, view)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": _headers(response.headers.items()),
+            }
+        )
+        body = getattr(response, "async_body", None)
+        if body is None:
+            await send(_body(response.get_data()))
+        else:
+            await self._stream(body, receive, send)
+
+    async def _stream(self, body, receive, send):
+        """
+        Send the chunks of the async iterator `body` until it ends or the
+        client disconnects, whichever comes first.
+        """
+
+        async def pump():
+            async for chunk in body:
+                await send(_body(chunk.encode(), more_body=True))
+            await send(_body(b""))
+
+        async def disconnect():
+            message = await receive()
+            while message["type"] == "http.request" and message.get("more_body"):
+                message = await receive()
+            if message["type"] == "http.request":
+                # The body is read: the next message can only be the disconnect.
+                await receive()
+
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnect())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await body.aclose()
+
+    def _match(self, environ):
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        query = parse_qs(environ["QUERY_STRING"])
+        if endpoint == "index" and normalize_query(query.get("q", [""])[0]):
+            # Full-text search keeps to the sync code path.
+            return None
+        return ASYNC_VIEWS.get(endpoint)
+
+    async def _blocking(self, func, *args):
+        if self.inline_session:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def _dispatch(self, environ, view):
+        app = self.app
+        ctx = app.request_context(environ)
+        ctx.push()
+        try:
+            try:
+                # Runs load_logged_in_user(), which reads the session.
+                rv = await self._blocking(app.preprocess_request)
+                if rv is None:
+                    rv = view(**request.view_args)
+                    if inspect.isawaitable(rv):
+                        rv = await rv
+            except Exception as exc:
+                rv = app.handle_user_exception(exc)
+            response = app.make_response(rv)
+            return await self._blocking(app.process_response, response)
+        except Exception as exc:
+            return app.handle_exception(exc)
+        finally:
+            ctx.pop()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.app.extensions["async_engine"].dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
@@ -0,0 +1,176 @@
+"""
+Sync (WSGI, a fixed number of worker threads) against async (ASGI, one event
+loop) throughput of the read endpoints, with simulated database latency.
+
+    python -m benchmarks.async_views --latency-ms 20 --concurrency 64 --threads 4
+
+Every SQL statement first runs `SELECT sleep_ms(<latency>)` on its own
+connection, i.e. the latency is spent on the database side like a network
+round trip: it holds a worker thread in the sync app but only a pooled
+connection in the async one. Both apps are driven in-process (no sockets):
+--concurrency clients each send their share of --requests, and the sync app
+serves at most --threads of them at once, like a gthread worker.
+
+Runs against a throwaway SQLite file (the latency function is SQLite-only).
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from benchmarks.database import use_bench_database
+from benchmarks.load_test import summarize
+from benchmarks.suite import report
+
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+def add_latency(engine, latency_ms: float) -> None:
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def _register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("sleep_ms", 1, _sleep_ms)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _delay(conn, cursor, statement, parameters, context, executemany):
+        cursor.execute("SELECT sleep_ms(?)", (latency_ms,))
+
+
+def run_sync(app, cookie, path, clients, requests, threads) -> dict:
+    latencies, errors, lock = [], [0], threading.Lock()
+    workers = threading.BoundedSemaphore(threads)
+
+    def client():
+        test_client = app.test_client()
+        test_client.set_cookie("session", cookie)
+        mine, failed = [], 0
+        for _ in range(requests // clients):
+            start = time.perf_counter()
+            with workers:
+                status = test_client.get(path).status_code
+            mine.append(time.perf_counter() - start)
+            failed += status >= 400
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+async def _asgi_get(asgi, path: str, cookie: str) -> int:
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(b"host", b"localhost"), (b"cookie", f"session={cookie}".encode())],
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 0),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi(scope, receive, send)
+    return messages[0]["status"]
+
+
+async def run_async(asgi, cookie, path, clients, requests) -> dict:
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal errors
+        for _ in range(requests // clients):
+            start = time.perf_counter()
+            status = await _asgi_get(asgi, path, cookie)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument(
+        "--path", action="append", help="default: /api/v1/tasks, / and /api/v1/summary"
+    )
+    args = parser.parse_args()
+
+    use_bench_database("async.db")
+    os.environ["ASYNC_DB"] = "1"
+    # Enough connections for every client: the comparison is about threads.
+    os.environ["DB_POOL_SIZE"] = str(args.concurrency)
+    os.environ.setdefault("FRAGMENT_CACHE_ENABLED", "0")
+    os.environ.setdefault("QUERY_BUDGET_MODE", "off")
+    os.environ.setdefault("SLOW_QUERY_MS", "60000")
+
+    from app import create_app
+    from async_views import AsyncApp
+    from counters import reconcile_counters
+    from extensions import db
+    from flask_migrate import upgrade
+
+    from benchmarks.seed import PASSWORD, seed
+
+    app = create_app()
+    with app.app_context():
+        upgrade()
+        seed(1, args.tasks)
+        reconcile_counters()
+        add_latency(db.engine, args.latency_ms)
+        # Reconnect, so that every pooled connection has sleep_ms().
+        db.engine.dispose()
+    add_latency(app.extensions["async_engine"].sync_engine, args.latency_ms)
+
+    login = app.test_client()
+    login.post("/login", data={"username": "bench_0", "password": PASSWORD})
+    cookie = login.get_cookie("session").value
+    asgi = AsyncApp(app)
+
+    print(
+        f"{args.latency_ms:g} ms per statement, {args.concurrency} clients, "
+        f"{args.threads} sync threads, {args.requests} requests per run\n"
+    )
+    # One loop for every run: the async pool's connections belong to it.
+    loop = asyncio.new_event_loop()
+    for url in args.path or ("/api/v1/tasks", "/", "/api/v1/summary"):
+        sync = run_sync(
+            app, cookie, url, args.concurrency, args.requests, args.threads
+        )
+        report("sync", sync)
+        result = loop.run_until_complete(
+            run_async(asgi, cookie, url, args.concurrency, args.requests)
+        )
+        report("async", result)
+        print(f"  {url}: async/sync throughput x{result['rps'] / sync['rps']:.1f}\n")
+    loop.run_until_complete(app.extensions["async_engine"].dispose())
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# benchmarks/database.py
+import os
+import tempfile
+
+
+def use_bench_database(filename: str) -> str:
+    """
+    Point create_app() at BENCH_DATABASE_URL, or else at a new SQLite file
+    `filename` in a temporary directory, and return that URL. Replicas and
+    rate limits are turned off.
+
+    DATABASE_URL is never used: benchmarks drop and seed tables, so the
+    database they run against has to be named for them.
+    """
+    url = os.environ.get("BENCH_DATABASE_URL") or (
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), filename)}"
+    )
+    os.environ["DATABASE_URL"] = url
+    # Every read has to see the rows just seeded.
+    os.environ.pop("DATABASE_REPLICA_URLS", None)
+    # Virtual users log in far more often than any person could.
+    os.environ["RATE_LIMIT_BACKEND"] = "off"
+    return url
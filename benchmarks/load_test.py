@@ -0,0 +1,202 @@
+"""
+HTTP load test of the task list, against a running server or comparing the
+Werkzeug development server with the gunicorn production setup.
+
+    python -m benchmarks.load_test --url http://localhost:5001 --concurrency 32
+    python -m benchmarks.load_test --compare --workers 4 --threads 4
+
+--url expects users seeded by benchmarks.seed (bench_<n> / bench-password).
+--compare seeds a throwaway SQLite database and starts each server in turn.
+"""
+import argparse
+import http.cookiejar
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from benchmarks.database import use_bench_database
+from benchmarks.seed import PASSWORD
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": len(ordered) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+    }
+
+
+def run_load(base_url, users, concurrency, duration, path="/"):
+    latencies, lock = [], threading.Lock()
+    errors = [0]
+    deadline = time.perf_counter() + duration
+
+    def client(n):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        form = urllib.parse.urlencode(
+            {"username": f"bench_{n % users}", "password": PASSWORD}
+        ).encode()
+        opener.open(f"{base_url}/login", data=form).read()
+
+        mine = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                opener.open(f"{base_url}{path}").read()
+            except OSError:
+                with lock:
+                    errors[0] += 1
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def seed_database(users: int, tasks_per_user: int) -> str:
+    database_url = use_bench_database("load_test.db")
+
+    from app import create_app
+    from extensions import db
+
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(users, tasks_per_user)
+        db.engine.dispose()
+    return database_url
+
+
+def compare(args) -> None:
+    database_url = seed_database(args.users, args.tasks_per_user)
+    servers = {
+        "werkzeug dev server": lambda port: [
+            sys.executable,
+            "-c",
+            f"from wsgi import app; app.run(host='127.0.0.1', port={port})",
+        ],
+        f"gunicorn {args.workers}x{args.threads}": lambda port: [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "wsgi:app",
+        ],
+    }
+
+    for name, command in servers.items():
+        port = free_port()
+        env = dict(
+            os.environ,
+            DATABASE_URL=database_url,
+            GUNICORN_BIND=f"127.0.0.1:{port}",
+            WEB_CONCURRENCY=str(args.workers),
+            GUNICORN_THREADS=str(args.threads),
+            GUNICORN_ACCESSLOG="",
+        )
+        server = subprocess.Popen(
+            command(port),
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(port)
+            report(
+                name,
+                run_load(
+                    f"http://127.0.0.1:{port}",
+                    args.users,
+                    args.concurrency,
+                    args.duration,
+                ),
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def report(name: str, result: dict) -> None:
+    print(
+        f"{name:<28} {result['rps']:8.1f} req/s  "
+        f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  "
+        f"p99 {result['p99_ms']:7.1f} ms  "
+        f"({result['requests']} requests, {result['errors']} errors)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="base URL of an already running server")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--tasks-per-user", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args)
+    elif args.url:
+        report(
+            args.url,
+            run_load(args.url.rstrip("/"), args.users, args.concurrency, args.duration),
+        )
+    else:
+        parser.error("pass --url or --compare")
+
+
+if __name__ == "__main__":
+    main()
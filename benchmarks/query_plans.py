@@ -0,0 +1,130 @@
+"""
+Query plans of the hot task queries before and after the composite indexes
+added by migration 0002_task_indexes.
+
+    python -m benchmarks.query_plans --users 20 --tasks-per-user 5000
+
+Runs against BENCH_DATABASE_URL when it is set (use a scratch database: every
+table is dropped), otherwise against a throwaway SQLite file; DATABASE_URL is
+ignored.
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import event
+
+from benchmarks.database import use_bench_database
+
+
+def capture_sql(engine, fn):
+    """
+    Run fn() and return the last (statement, parameters) it sent to the driver.
+    """
+    captured = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    return captured[-1]
+
+
+def explain(engine, statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks-per-user", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    use_bench_database("query_plans.db")
+
+    from app import create_app
+    from extensions import db
+    from models import Task
+    from pagination import keyset_paginate
+
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        db.drop_all()
+        db.create_all()
+        indexes = [idx for idx in Task.__table__.indexes if idx.name.startswith("ix_")]
+        for idx in indexes:
+            idx.drop(engine)
+
+        user_ids = seed(args.users, args.tasks_per_user)
+        user_id = user_ids[len(user_ids) // 2]
+        some_task = Task.query.filter_by(user_id=user_id).first()
+        deep_cursor = keyset_paginate(
+            Task.query.filter_by(user_id=user_id),
+            Task.due_date,
+            Task.id,
+            None,
+            args.tasks_per_user // 2,
+        ).next_cursor
+
+        def page(status="all", cursor=None):
+            query = Task.query_for(user_id, status)
+            return lambda: keyset_paginate(query, Task.due_date, Task.id, cursor, 50)
+
+        queries = {
+            "index status=all": page(),
+            "index status=open": page(status="open"),
+            "index status=done": page(status="done"),
+            "index deep page": page(cursor=deep_cursor),
+            "edit/toggle/delete lookup": lambda: Task.query.filter_by(
+                id=some_task.id, user_id=user_id
+            ).first(),
+        }
+
+        def report(label):
+            print(f"=== {label} ===")
+            for name, fn in queries.items():
+                statement, parameters = capture_sql(engine, fn)
+                db.session.rollback()
+                print(f"-- {name}: {median_ms(fn, args.repeat):.2f} ms (median)")
+                for line in explain(engine, statement, parameters):
+                    print(f"     {line}")
+            print()
+
+        print(
+            f"{engine.dialect.name}: {len(user_ids)} users x "
+            f"{args.tasks_per_user} tasks\n"
+        )
+        report("before (primary key only)")
+
+        for idx in indexes:
+            idx.create(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        report("after (composite + partial indexes)")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Task search: the naive ILIKE '%term%' scan against search_tasks().
+
+    python -m benchmarks.search --users 100 --tasks-per-user 10000 --term invoice
+
+Defaults to one million tasks. Runs against BENCH_DATABASE_URL when it is set
+(use a scratch database: every table is dropped), otherwise against a throwaway
+SQLite file; DATABASE_URL is ignored. On PostgreSQL search_tasks() is timed
+with and without the ix_tasks_search GIN index; SQLite has no full-text index
+and both variants scan the user's tasks.
+"""
+import argparse
+
+from sqlalchemy import or_
+
+from benchmarks.database import use_bench_database
+from benchmarks.query_plans import capture_sql, explain, median_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks-per-user", type=int, default=10000)
+    parser.add_argument("--term", default="invoice")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    use_bench_database("search.db")
+
+    from app import create_app
+    from extensions import db
+    from models import Task
+    from search import search_tasks
+
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        db.drop_all()
+        db.create_all()
+        user_ids = seed(args.users, args.tasks_per_user)
+        user_id = user_ids[len(user_ids) // 2]
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+        pattern = f"%{args.term}%"
+        queries = {
+            "ILIKE, one user": lambda: Task.query_for(user_id)
+            .filter(or_(Task.title.ilike(pattern), Task.description.ilike(pattern)))
+            .order_by(Task.due_date, Task.id)
+            .limit(50)
+            .all(),
+            "ILIKE count, whole table": lambda: Task.query.filter(
+                or_(Task.title.ilike(pattern), Task.description.ilike(pattern))
+            ).count(),
+            "search_tasks, one user": lambda: search_tasks(
+                Task.query_for(user_id), args.term, None, 50
+            ),
+        }
+
+        def report(label):
+            print(f"=== {label} ===")
+            for name, fn in queries.items():
+                statement, parameters = capture_sql(engine, fn)
+                db.session.rollback()
+                print(f"-- {name}: {median_ms(fn, args.repeat):.2f} ms (median)")
+                for line in explain(engine, statement, parameters):
+                    print(f"     {line}")
+            print()
+
+        print(
+            f"{engine.dialect.name}: {len(user_ids)} users x "
+            f"{args.tasks_per_user} tasks, term {args.term!r}\n"
+        )
+        search_index = next(
+            i for i in Task.__table__.indexes if i.name == "ix_tasks_search"
+        )
+        if engine.dialect.name == "postgresql":
+            search_index.drop(engine)
+            report("without ix_tasks_search")
+            search_index.create(engine)
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ANALYZE tasks")
+            report("with ix_tasks_search")
+        else:
+            report("LIKE fallback")
+
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/seed.py
+import random
+from datetime import date, timedelta
+
+from extensions import db
+from models import Task, User
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+
+PASSWORD = "bench-password"
+
+VERBS = ["call", "email", "review", "pay", "book", "fix", "plan", "clean", "order"]
+NOUNS = [
+    "plumber", "invoice", "dentist", "report", "flights", "garden", "budget",
+    "meeting", "groceries", "car", "taxes", "slides", "backup", "contract",
+]
+
+
+def seed(users: int, tasks_per_user: int, rng_seed: int = 42, chunk: int = 5000):
+    """
+    Insert `users` users named bench_<n>, each owning `tasks_per_user` tasks.
+
+    Due dates spread from two months ago to four months ahead (10% undated) and
+    roughly 40% of the tasks are completed. Titles are "<verb> <noun> #<n>"
+    and half the tasks have a description, so searches have words to match.
+    Returns the new user ids.
+    """
+    rng = random.Random(rng_seed)
+    password_hash = generate_password_hash(PASSWORD)
+
+    db.session.execute(
+        insert(User),
+        [
+            {"username": f"bench_{n}", "password_hash": password_hash}
+            for n in range(users)
+        ],
+    )
+    user_ids = db.session.scalars(
+        select(User.id).where(User.username.like("bench\\_%", escape="\\"))
+    ).all()
+
+    today = date.today()
+    rows = []
+    for user_id in user_ids:
+        for n in range(tasks_per_user):
+            due = None
+            if rng.random() >= 0.1:
+                due = today + timedelta(days=rng.randint(-60, 120))
+            description = None
+            if rng.random() < 0.5:
+                description = f"{rng.choice(VERBS)} the {rng.choice(NOUNS)} first"
+            rows.append(
+                {
+                    "title": f"{rng.choice(VERBS)} {rng.choice(NOUNS)} #{n}",
+                    "description": description,
+                    "due_date": due,
+                    "is_completed": rng.random() < 0.4,
+                    "user_id": user_id,
+                }
+            )
+            if len(rows) >= chunk:
+                db.session.execute(insert(Task), rows)
+                rows = []
+    if rows:
+        db.session.execute(insert(Task), rows)
+
+    db.session.commit()
+    return user_ids
@@ -0,0 +1,97 @@
+"""
+Startup cost: time to import the app module and to run create_app().
+
+    python -m benchmarks.startup --runs 20
+
+Imports are timed in fresh interpreters so nothing is cached between runs.
+create_app() is timed in-process while counting the database connections it
+opens, which should be zero. --with-create-all adds the old per-boot
+db.create_all() for comparison.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from benchmarks.database import use_bench_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import app; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(out.stdout.strip()))
+    return timings
+
+
+def time_create_app(runs: int, with_create_all: bool) -> tuple[list, int]:
+    from app import create_app
+    from extensions import db
+
+    connections = [0]
+
+    def _count(dbapi_connection, connection_record):
+        connections[0] += 1
+
+    event.listen(Pool, "connect", _count)
+    timings = []
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            app = create_app()
+            if with_create_all:
+                with app.app_context():
+                    db.create_all()
+            timings.append(time.perf_counter() - start)
+            with app.app_context():
+                db.engine.dispose()
+    finally:
+        event.remove(Pool, "connect", _count)
+    return timings, connections[0]
+
+
+def line(label: str, timings: list) -> str:
+    return (
+        f"{label:<28} median {statistics.median(timings) * 1000:8.2f} ms  "
+        f"min {min(timings) * 1000:8.2f} ms  max {max(timings) * 1000:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--with-create-all", action="store_true")
+    args = parser.parse_args()
+
+    use_bench_database("startup.db")
+
+    print(line("import app", time_import(args.runs)))
+    timings, connections = time_create_app(args.runs, False)
+    print(line("create_app()", timings))
+    print(f"{'':<28} {connections} database connections opened")
+    if args.with_create_all:
+        timings, connections = time_create_app(args.runs, True)
+        print(line("create_app() + create_all()", timings))
+        print(f"{'':<28} {connections} database connections opened")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Benchmark suite: seeds users and tasks, then drives the real routes.
+
+    python -m benchmarks.suite --users 20 --tasks-per-user 200 --requests 200
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+Scenarios: index with each filter, create_task, toggle_task, login and a
+mixed workload. Requests go through the WSGI app in-process (one test client
+per thread, no sockets), so runs are reproducible and need no network.
+
+Runs against BENCH_DATABASE_URL when it is set, e.g. a local PostgreSQL
+(use a scratch database: every table is dropped), otherwise against a
+throwaway SQLite file; DATABASE_URL is ignored. With --baseline, exits with
+status 1 when a scenario's p95 latency or throughput is worse than the
+baseline by more than --tolerance.
+Baselines are only comparable on the same machine and database.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import threading
+import time
+
+from benchmarks.database import use_bench_database
+from benchmarks.load_test import summarize
+from benchmarks.seed import PASSWORD
+
+# (weight, action) of the mixed workload: mostly reads, like real traffic.
+MIXED = (
+    (40, "index_all"),
+    (15, "index_open"),
+    (10, "index_done"),
+    (15, "create_task"),
+    (15, "toggle_task"),
+    (5, "login"),
+)
+
+
+class VirtualUser:
+    """
+    One benchmark client: its own cookie jar, logged in as a seeded user.
+    """
+
+    def __init__(self, app, username: str, task_ids: list, rng_seed: int):
+        self.client = app.test_client()
+        self.username = username
+        self.task_ids = task_ids
+        self.rng = random.Random(rng_seed)
+
+    def index_all(self):
+        return self.client.get("/?status=all")
+
+    def index_open(self):
+        return self.client.get("/?status=open")
+
+    def index_done(self):
+        return self.client.get("/?status=done")
+
+    def create_task(self):
+        return self.client.post(
+            "/tasks/new", data={"title": f"Benchmark task {self.rng.random():.6f}"}
+        )
+
+    def toggle_task(self):
+        return self.client.post(f"/tasks/{self.rng.choice(self.task_ids)}/toggle")
+
+    def login(self):
+        return self.client.post(
+            "/login", data={"username": self.username, "password": PASSWORD}
+        )
+
+    def mixed(self):
+        weights, actions = zip(*MIXED)
+        action = self.rng.choices(actions, weights=weights)[0]
+        return getattr(self, action)()
+
+
+SCENARIOS = (
+    "index_all",
+    "index_open",
+    "index_done",
+    "create_task",
+    "toggle_task",
+    "login",
+    "mixed",
+)
+
+
+def run_scenario(clients: list, name: str, requests: int, warmup: int) -> dict:
+    latencies, errors, lock = [], [0], threading.Lock()
+    per_client = max(1, requests // len(clients))
+
+    def drive(user):
+        action = getattr(user, name)
+        for _ in range(warmup):
+            action()
+        mine, failed = [], 0
+        for _ in range(per_client):
+            start = time.perf_counter()
+            status = action().status_code
+            mine.append(time.perf_counter() - start)
+            failed += status >= 400
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=drive, args=(user,)) for user in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Human-readable regressions of `results` against a saved baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']:.1f} ms vs {base['p95_ms']:.1f} ms"
+            )
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['rps']:.1f} req/s vs {base['rps']:.1f} req/s"
+            )
+        if result["errors"] > base["errors"]:
+            regressions.append(
+                f"{name}: {result['errors']} errors vs {base['errors']}"
+            )
+    return regressions
+
+
+def report(name: str, result: dict) -> None:
+    print(
+        f"{name:<12} {result['rps']:8.1f} req/s  "
+        f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+        f"p99 {result['p99_ms']:7.2f} ms  "
+        f"({result['requests']} requests, {result['errors']} errors)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks-per-user", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS)
+    parser.add_argument("--baseline", help="JSON file to compare the results with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", help="write the results to this file")
+    args = parser.parse_args()
+
+    database_url = use_bench_database("suite.db")
+
+    from app import create_app
+    from counters import reconcile_counters
+    from extensions import db
+    from flask_migrate import upgrade
+    from models import Task, User
+    from sqlalchemy import select
+
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(db.text("DROP TABLE IF EXISTS alembic_version"))
+        db.session.commit()
+        upgrade()
+        seed(args.users, args.tasks_per_user)
+        reconcile_counters()
+
+        clients = []
+        for n in range(args.concurrency):
+            username = f"bench_{n % args.users}"
+            user_id = db.session.scalar(select(User.id).filter_by(username=username))
+            task_ids = db.session.scalars(
+                select(Task.id).filter_by(user_id=user_id).limit(500)
+            ).all()
+            clients.append(VirtualUser(app, username, task_ids, rng_seed=n))
+        db.session.remove()
+
+    for user in clients:
+        user.login()
+
+    print(
+        f"{database_url.split(':', 1)[0]}: {args.users} users x "
+        f"{args.tasks_per_user} tasks, {args.concurrency} clients, "
+        f"{args.requests} requests per scenario\n"
+    )
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(clients, name, args.requests, args.warmup)
+        report(name, results[name])
+
+    with app.app_context():
+        db.drop_all()
+        db.session.execute(db.text("DROP TABLE IF EXISTS alembic_version"))
+        db.session.commit()
+
+    if args.save_baseline:
+        settings = ("users", "tasks_per_user", "requests", "concurrency")
+        with open(args.save_baseline, "w") as fh:
+            json.dump(
+                {
+                    "settings": {key: getattr(args, key) for key in settings},
+                    "machine": f"{platform.system()} {platform.machine()}, "
+                    f"Python {platform.python_version()}",
+                    "scenarios": results,
+                },
+                fh,
+                indent=2,
+            )
+            fh.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        print()
+        settings = {key: getattr(args, key) for key in baseline["settings"]}
+        if settings != baseline["settings"]:
+            print(f"Note: the baseline was recorded with {baseline['settings']}")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.tolerance:.0%} of the baseline.")
+
+if __name__ == "__main__":
+    main()
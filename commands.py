@@ -0,0 +1,159 @@
+# commands.py
+import json
+import time
+from datetime import timedelta
+
+import click
+from counters import reconcile_counters
+from deletion import delete_user, purge_deleted_tasks
+from events import publish_task_event
+from extensions import db
+from flask import current_app
+from flask.cli import AppGroup
+from fragments import bump_task_list
+from jobs import HANDLERS, Worker, enqueue
+from models import STATUS_FILTERS, User
+from sessions import session_store
+from transfer import FORMATS, TaskImportError, detect_format, export_tasks, import_tasks
+
+counters_cli = AppGroup("counters", help="Per-user task counters.")
+tasks_cli = AppGroup("tasks", help="Import and export a user's tasks.")
+sessions_cli = AppGroup("sessions", help="Server-side sessions.")
+users_cli = AppGroup("users", help="User accounts.")
+jobs_cli = AppGroup("jobs", help="Background jobs.")
+
+
+@counters_cli.command("reconcile")
+@click.option("--batch-size", default=1000, show_default=True)
+def reconcile_command(batch_size):
+    """Recompute every user's counters from the tasks table."""
+    users = reconcile_counters(batch_size)
+    click.echo(f"Reconciled counters for {users} users.")
+
+
+def _user_id(username: str) -> int:
+    user = User.query.filter_by(username=username).one_or_none()
+    if user is None:
+        raise click.BadParameter(f"No user named {username!r}.")
+    return user.id
+
+
+@tasks_cli.command("import")
+@click.argument("username")
+@click.argument("source", type=click.File("rb"))
+@click.option("--format", "fmt", type=click.Choice(FORMATS))
+@click.option("--batch-size", type=int)
+def import_command(username, source, fmt, batch_size):
+    """Import tasks from a CSV or JSONL file ("-" for stdin)."""
+    user_id = _user_id(username)
+    try:
+        result = import_tasks(
+            user_id,
+            source,
+            fmt or detect_format(source.name, None),
+            batch_size=batch_size or current_app.config["IMPORT_BATCH_SIZE"],
+        )
+    except TaskImportError as exc:
+        raise click.UsageError(str(exc)) from None
+
+    if result.imported:
+        bump_task_list(user_id)
+        publish_task_event(user_id, "reset")
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Imported {result.imported} tasks, {result.error_count} rows rejected.")
+
+
+@tasks_cli.command("export")
+@click.argument("username")
+@click.argument("target", type=click.File("w"), default="-")
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="jsonl")
+@click.option("--status", type=click.Choice(STATUS_FILTERS), default="all")
+def export_command(username, target, fmt, status):
+    """Export tasks as CSV or JSONL to a file (stdout by default)."""
+    for chunk in export_tasks(_user_id(username), fmt, status):
+        target.write(chunk)
+
+
+@tasks_cli.command("purge")
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option(
+    "--older-than", type=float, help="Seconds since deletion [DELETED_TASK_TTL]"
+)
+@click.option("--every", type=float, help="Keep running, purging every N seconds.")
+def purge_command(batch_size, older_than, every):
+    """Hard-delete tasks soft-deleted longer ago than the undo window."""
+    if older_than is None:
+        older_than = current_app.config["DELETED_TASK_TTL"]
+    while True:
+        purged = purge_deleted_tasks(timedelta(seconds=older_than), batch_size)
+        click.echo(f"Purged {purged} deleted tasks.")
+        if not every:
+            return
+        time.sleep(every)
+
+
+def _store():
+    store = session_store(current_app)
+    if store is None:
+        raise click.UsageError("SESSION_BACKEND=cookie keeps no sessions server-side.")
+    return store
+
+
+@sessions_cli.command("gc")
+@click.option("--batch-size", default=1000, show_default=True)
+def sessions_gc_command(batch_size):
+    """Delete expired sessions in batches."""
+    click.echo(f"Deleted {_store().gc(batch_size)} expired sessions.")
+
+
+@sessions_cli.command("revoke")
+@click.argument("username")
+def sessions_revoke_command(username):
+    """Log a user out of every session right away."""
+    click.echo(f"Revoked {_store().revoke_user(_user_id(username))} sessions.")
+
+
+@users_cli.command("delete")
+@click.argument("username")
+@click.confirmation_option(prompt="Delete this user and all their tasks?")
+def users_delete_command(username):
+    """Delete a user with all their tasks."""
+    delete_user(_user_id(username))
+    click.echo(f"Deleted user {username!r}.")
+
+
+@jobs_cli.command("worker")
+@click.option("--concurrency", type=int, help="Jobs run at once [JOB_CONCURRENCY]")
+@click.option("--poll", default=1.0, show_default=True, help="Seconds between polls.")
+@click.option("--once", is_flag=True, help="Exit once no job is due.")
+@click.option(
+    "--schedule/--no-schedule", default=True, help="Enqueue the scheduled jobs."
+)
+def jobs_worker_command(concurrency, poll, once, schedule):
+    """Run background jobs until stopped (SIGTERM, Ctrl-C)."""
+    app = current_app._get_current_object()
+    worker = Worker(app, concurrency or app.config["JOB_CONCURRENCY"], schedule)
+    click.echo(f"Ran {worker.run(poll, once)} jobs.")
+
+
+@jobs_cli.command("enqueue")
+@click.argument("name", type=click.Choice(sorted(HANDLERS)))
+@click.option("--payload", default="{}", help="Keyword arguments, as JSON.")
+def jobs_enqueue_command(name, payload):
+    """Queue a job to run as soon as a worker is free."""
+    try:
+        kwargs = json.loads(payload)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint="--payload") from None
+    job_id = enqueue(name, kwargs)
+    db.session.commit()
+    click.echo(f"Enqueued job {job_id}.")
+
+
+def register_commands(app) -> None:
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(tasks_cli)
+    app.cli.add_command(sessions_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(jobs_cli)
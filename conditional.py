@@ -0,0 +1,128 @@
+# conditional.py
+import hashlib
+import os
+from datetime import UTC
+from functools import lru_cache
+
+from extensions import db
+from flask import Response, abort, g, request, session
+from flask.globals import request_ctx
+from models import Task
+from sqlalchemy import func, select
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+
+@lru_cache(maxsize=1)
+def _templates_digest() -> str:
+    # Part of every ETag so that a deploy changing the markup isn't answered
+    # with 304s for pages the browser cached from the previous release.
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        with open(os.path.join(TEMPLATES_DIR, name), "rb") as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()
+
+
+def make_etag(*parts) -> str:
+    raw = repr((_templates_digest(), parts)).encode()
+    return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+
+def task_list_stamp(user_id: int):
+    """
+    The indexed aggregate behind task_list_validators(): (count, last update).
+    Soft-deleted rows are counted too: deleting or restoring a task bumps its
+    updated_at, and leaving them in keeps this an index-only scan.
+    """
+    return select(func.count(Task.id), func.max(Task.updated_at)).where(
+        Task.user_id == user_id
+    )
+
+
+def task_list_etag(user_id: int, stamp, key_parts: tuple):
+    count, last_modified = stamp
+    return make_etag(user_id, count, last_modified, *key_parts), last_modified
+
+
+def task_list_version(user_id: int, stamp) -> str:
+    """
+    Identifies the state of the whole task list, whatever the page or filter:
+    pages embed it and live updates (events.py) carry the latest one.
+    """
+    return make_etag(user_id, *stamp)
+
+
+def task_list_validators(user_id: int, *key_parts):
+    """
+    ETag and Last-Modified of a user's task list from one indexed aggregate.
+    """
+    stamp = db.session.execute(task_list_stamp(user_id)).one()
+    return task_list_etag(user_id, stamp, key_parts)
+
+
+def task_stamp(user_id: int, task_id: int):
+    return select(Task.updated_at).where(
+        Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None)
+    )
+
+
+def task_etag(user_id: int, task_id: int, last_modified):
+    if last_modified is None:
+        abort(404)
+    return make_etag(user_id, task_id, last_modified), last_modified
+
+
+def task_validators(user_id: int, task_id: int):
+    """
+    ETag and Last-Modified of one task; 404 when the user doesn't own it.
+    """
+    last_modified = db.session.scalar(task_stamp(user_id, task_id))
+    return task_etag(user_id, task_id, last_modified)
+
+
+def pop_once(key: str):
+    """
+    session.pop() for state a page shows once, like the undo form: that page
+    then gets no validators (see add_validators()).
+    """
+    value = session.pop(key, None)
+    if value is not None:
+        g.rendered_once = True
+    return value
+
+
+def add_validators(response: Response, etag: str, last_modified) -> Response:
+    # A page showing flashes or pop_once() state must not come back from the
+    # browser cache on a later 304 (the ETag doesn't cover that state).
+    if request_ctx.flashes or g.get("rendered_once"):
+        response.cache_control.no_store = True
+        return response
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=UTC)
+    # Cacheable by the browser only, and always revalidated.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag: str, last_modified) -> Response | None:
+    """
+    A 304 response when the client's copy is still current, otherwise None.
+    """
+    # Pending flash messages have to be rendered, whatever the validators say.
+    if "_flashes" in session:
+        return None
+
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        modified = last_modified.replace(tzinfo=UTC, microsecond=0)
+        fresh = modified <= request.if_modified_since
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    return add_validators(Response(status=304), etag, last_modified)
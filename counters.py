@@ -0,0 +1,166 @@
+# counters.py
+from datetime import date
+
+from extensions import db
+from models import Task, TaskCounter, User, request_today
+from replicas import primary
+from sqlalchemy import Date, func, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def _count(*criteria):
+    return (
+        select(func.count(Task.id))
+        .where(Task.deleted_at.is_(None), *criteria)
+        .scalar_subquery()
+    )
+
+
+def _counts_for(user_id_col, today: date) -> dict:
+    # Correlated counts for the user in user_id_col, each served by an index
+    # starting with tasks.user_id.
+    return {
+        "open_count": _count(Task.user_id == user_id_col, ~Task.is_completed),
+        "done_count": _count(Task.user_id == user_id_col, Task.is_completed),
+        "overdue_count": _count(Task.user_id == user_id_col, Task.is_overdue(today)),
+        "overdue_as_of": literal(today, Date),
+    }
+
+
+def _is_overdue(state, today: date) -> bool:
+    return (
+        state is not None
+        and not state[0]
+        and state[1] is not None
+        and state[1] < today
+    )
+
+
+def apply_task_changes(user_id: int, changes) -> None:
+    """
+    Fold task mutations into the user's counters, in the current transaction.
+
+    `changes` yields (before, after) pairs where each side is a task's
+    (is_completed, due_date), or None when the task doesn't exist on that side.
+    Call it after the mutation itself has been executed.
+    """
+    today = request_today()
+    open_delta = done_delta = 0
+    overdue_touched = False
+    for before, after in changes:
+        for state, sign in ((before, -1), (after, 1)):
+            if state is None:
+                continue
+            if state[0]:
+                done_delta += sign
+            else:
+                open_delta += sign
+            overdue_touched = overdue_touched or _is_overdue(state, today)
+
+    values = {
+        "open_count": TaskCounter.open_count + open_delta,
+        "done_count": TaskCounter.done_count + done_delta,
+    }
+    if overdue_touched:
+        values["overdue_as_of"] = None
+    update_counters = (
+        update(TaskCounter).where(TaskCounter.user_id == user_id).values(**values)
+    )
+    if db.session.execute(update_counters).rowcount:
+        return
+    # No counters yet (rows written before they existed): count from scratch,
+    # which already includes the mutation being recorded. Unless a concurrent
+    # first write inserted them meanwhile, from rows without this mutation:
+    # then apply it to theirs.
+    if not _insert_counters(today, User.id == user_id):
+        db.session.execute(update_counters)
+
+
+def _insert_counters(today: date, *criteria) -> int:
+    """
+    Insert the counters of the users matching `criteria`, skipping any that
+    exist by then. Returns the number of rows inserted.
+    """
+    counts = _counts_for(User.id, today)
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    return db.session.execute(
+        dialect.insert(TaskCounter)
+        .from_select(
+            ["user_id", *counts], select(User.id, *counts.values()).where(*criteria)
+        )
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    ).rowcount
+
+
+def task_summary(user_id: int) -> dict:
+    """
+    Open, done and overdue counts of the user: a primary key lookup, plus one
+    indexed count the first time they are read on a given day.
+    """
+    today = request_today()
+    counter = db.session.get(TaskCounter, user_id)
+    if counter is not None and counter.overdue_as_of == today:
+        return counter_summary(counter)
+
+    # About to write: count from the primary, not from a lagging replica.
+    with primary():
+        counter = db.session.get(TaskCounter, user_id, populate_existing=True)
+        if counter is None:
+            apply_task_changes(user_id, [])
+            db.session.commit()
+            counter = db.session.get(TaskCounter, user_id)
+
+        if counter.overdue_as_of != today:
+            counter.overdue_count = db.session.scalar(
+                select(func.count(Task.id)).where(
+                    Task.user_id == user_id,
+                    Task.deleted_at.is_(None),
+                    Task.is_overdue(today),
+                )
+            )
+            counter.overdue_as_of = today
+            db.session.commit()
+
+    return counter_summary(counter)
+
+
+def counter_summary(counter: TaskCounter) -> dict:
+    return {
+        "open": counter.open_count,
+        "done": counter.done_count,
+        "overdue": counter.overdue_count,
+        "total": counter.open_count + counter.done_count,
+    }
+
+
+def reconcile_counters(batch_size: int = 1000) -> int:
+    """
+    Recompute every user's counters from the tasks table, one batch of users
+    per transaction. Returns the number of users processed.
+    """
+    today = date.today()
+    processed, last_id = 0, 0
+    while True:
+        user_ids = db.session.scalars(
+            select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+        ).all()
+        if not user_ids:
+            return processed
+        low, high = user_ids[0], user_ids[-1]
+
+        db.session.execute(
+            update(TaskCounter)
+            .where(TaskCounter.user_id.between(low, high))
+            .values(**_counts_for(TaskCounter.user_id, today))
+        )
+        _insert_counters(
+            today,
+            User.id.between(low, high),
+            ~select(TaskCounter.user_id)
+            .where(TaskCounter.user_id == User.id)
+            .exists(),
+        )
+        db.session.commit()
+
+        processed += len(user_ids)
+        last_id = high
@@ -0,0 +1,98 @@
+# deletion.py
+from datetime import timedelta
+
+from counters import apply_task_changes
+from extensions import db
+from flask import current_app
+from identity import invalidate_user
+from models import Task, TaskCounter, User, _utcnow
+from sessions import session_store
+from sqlalchemy import delete, select, update
+
+
+def soft_delete_tasks(user_id: int, task_ids: list[int]) -> list[int]:
+    """
+    Mark the user's tasks as deleted and take them out of the counters, in
+    the current transaction. Returns the ids that were deleted by this call.
+    """
+    deleted = db.session.execute(
+        update(Task)
+        .where(
+            Task.user_id == user_id, Task.id.in_(task_ids), Task.deleted_at.is_(None)
+        )
+        .values(deleted_at=_utcnow())
+        .returning(Task.id, Task.is_completed, Task.due_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+    apply_task_changes(user_id, [(tuple(row[1:]), None) for row in deleted])
+    return [row[0] for row in deleted]
+
+
+def restore_tasks(user_id: int, task_ids: list[int]) -> list[int]:
+    """
+    Undo soft_delete_tasks() for the tasks that haven't been purged yet.
+    """
+    restored = db.session.execute(
+        update(Task)
+        .where(
+            Task.user_id == user_id,
+            Task.id.in_(task_ids),
+            Task.deleted_at.is_not(None),
+        )
+        .values(deleted_at=None)
+        .returning(Task.id, Task.is_completed, Task.due_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+    apply_task_changes(user_id, [(None, tuple(row[1:])) for row in restored])
+    return [row[0] for row in restored]
+
+
+def purge_deleted_tasks(older_than: timedelta, batch_size: int = 1000) -> int:
+    """
+    Hard-delete tasks soft-deleted more than `older_than` ago, `batch_size`
+    rows per transaction so locks and WAL stay bounded. Counters already
+    left them out when they were deleted. Returns the number of rows purged.
+    """
+    cutoff = _utcnow() - older_than
+    purged = 0
+    while True:
+        expired = (
+            select(Task.id)
+            .where(Task.deleted_at.is_not(None), Task.deleted_at <= cutoff)
+            .limit(batch_size)
+        )
+        count = db.session.execute(
+            delete(Task)
+            .where(Task.id.in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        purged += count
+        if count < batch_size:
+            return purged
+
+
+def delete_user(user_id: int) -> bool:
+    """
+    Delete a user with their tasks and counters: one set-based DELETE per
+    table in a single transaction, no rows loaded into the session. Their
+    server-side sessions are revoked. Returns False when there was no such user.
+    """
+    db.session.execute(
+        delete(Task)
+        .where(Task.user_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(delete(TaskCounter).where(TaskCounter.user_id == user_id))
+    deleted = db.session.execute(
+        delete(User)
+        .where(User.id == user_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    invalidate_user(user_id)
+    store = session_store(current_app)
+    if store is not None:
+        store.revoke_user(user_id)
+    return bool(deleted)
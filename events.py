@@ -0,0 +1,372 @@
+# events.py
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+
+from async_db import fetch_task, fetch_task_list_stamp, fetch_task_summary
+from conditional import task_list_stamp, task_list_version
+from counters import task_summary
+from extensions import db
+from flask import (
+    Response,
+    abort,
+    current_app,
+    g,
+    render_template,
+    stream_with_context,
+    url_for,
+)
+from models import Task, request_today
+from sqlalchemy import func
+
+BACKENDS = ("memory", "postgres", "off")
+
+# Actions after which the task is (re)rendered; "deleted" and "reset" aren't.
+UPSERT_ACTIONS = ("created", "updated", "restored")
+
+# No buffering by proxies (nginx) and no caching of the stream.
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    The pending events of one stream. Bounded: a stream that doesn't keep up
+    is marked as overflowed instead of blocking (or growing for) publishers.
+    """
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, message: dict) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float) -> dict | None:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription(Subscription):
+    """
+    Subscription read by a coroutine; deliver() is safe from any thread.
+    """
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+        self.loop = asyncio.get_running_loop()
+
+    def deliver(self, message: dict) -> None:
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: dict) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> dict | None:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """
+    In-process pub/sub: events only reach streams served by this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers[subscription.user_id].add(subscription)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, message: dict) -> None:
+        self._deliver(user_id, message)
+
+    def _deliver(self, user_id: int, message: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Pub/sub across processes and hosts with LISTEN/NOTIFY: publish() sends a
+    NOTIFY and a listener thread per process hands every notification to its
+    local streams. Payloads only carry ids (NOTIFY is limited to 8000 bytes).
+    """
+
+    CHANNEL = "task_events"
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def subscribe(self, subscription: Subscription) -> None:
+        # Started on first use so that forked workers each get their own.
+        with self._start_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="task-events", daemon=True
+                )
+                self._listener.start()
+        super().subscribe(subscription)
+
+    def publish(self, user_id: int, message: dict) -> None:
+        payload = json.dumps({"user_id": user_id, **message})
+        with self.engine.begin() as conn:
+            conn.execute(func.pg_notify(self.CHANNEL, payload).select())
+
+    def _connect(self):
+        # A dedicated connection outside the pool: it is held for good.
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        connection = self.engine.dialect.loaded_dbapi.connect(*cargs, **cparams)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {self.CHANNEL}")
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _notifications(self, connection):
+        """
+        Yield the payloads of the notifications received by `connection`,
+        with psycopg 3 (notifies() generator) or psycopg2 (poll()).
+        """
+        if callable(connection.notifies):
+            while True:
+                for notify in connection.notifies(timeout=5.0):
+                    yield notify.payload
+        while True:
+            if select.select([connection], [], [], 5.0) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                yield connection.notifies.pop(0).payload
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                connection = self._connect()
+                try:
+                    for payload in self._notifications(connection):
+                        message = json.loads(payload)
+                        self._deliver(message.pop("user_id"), message)
+                finally:
+                    # Out of the pool: nothing else would ever close it.
+                    connection.close()
+            except Exception:
+                logger.exception("Task event listener failed, reconnecting")
+                time.sleep(1.0)
+
+
+def publish_task_event(user_id: int, action: str, task_id: int | None = None):
+    """
+    Tell the user's open task lists that a task changed; call it after the
+    commit. "reset" (bulk changes) makes them reload instead.
+    """
+    broker = current_app.extensions.get("task_events")
+    if broker is None:
+        return
+    try:
+        broker.publish(user_id, {"action": action, "task_id": task_id})
+    except Exception:
+        # The change is committed: a missed event only delays the other tabs.
+        current_app.logger.exception("Could not publish a task event")
+
+
+def event_payload(message: dict, task, summary: dict, version: str) -> dict:
+    """
+    The JSON sent to the browser for a broker message. `task` is the live
+    task of an upsert action, or None when it's gone by now.
+    """
+    payload = {
+        "action": message["action"],
+        "id": message["task_id"],
+        "summary": summary,
+        "version": version,
+    }
+    if message["action"] in UPSERT_ACTIONS:
+        if task is None:
+            payload["action"] = "deleted"
+        else:
+            today = request_today()
+            payload.update(
+                action="upsert",
+                html=render_template("_task_item.html", task=task, today=today),
+                due_date=task.due_date.isoformat() if task.due_date else None,
+                is_completed=task.is_completed,
+                is_overdue=task.is_overdue(today),
+            )
+    return payload
+
+
+def _task_event(user_id: int, message: dict) -> dict:
+    task = None
+    if message["action"] in UPSERT_ACTIONS:
+        task = Task.query.filter_by(
+            id=message["task_id"], user_id=user_id, deleted_at=None
+        ).first()
+    stamp = db.session.execute(task_list_stamp(user_id)).one()
+    return event_payload(
+        message, task, task_summary(user_id), task_list_version(user_id, stamp)
+    )
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream(app, subscription: Subscription):
+    user_id = subscription.user_id
+    config = app.config
+    deadline = time.monotonic() + config["EVENTS_STREAM_SECONDS"]
+    try:
+        stamp = db.session.execute(task_list_stamp(user_id)).one()
+        yield f"retry: {int(config['EVENTS_RETRY_MS'])}\n"
+        yield sse("hello", {"version": task_list_version(user_id, stamp)})
+        db.session.remove()
+        while time.monotonic() < deadline:
+            message = subscription.get(config["EVENTS_HEARTBEAT"])
+            if subscription.overflowed:
+                yield sse("task", {"action": "reset"})
+                return
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            yield sse("task", _task_event(user_id, message))
+            # Each event is its own unit of work: no transaction held open
+            # while waiting, and a fresh query budget for the next one.
+            db.session.remove()
+            g.pop("request_queries", None)
+            g.pop("today", None)
+    finally:
+        app.extensions["task_events"].unsubscribe(subscription)
+
+
+async def _fetch_task_event(user_id: int, message: dict) -> dict:
+    task = None
+    if message["action"] in UPSERT_ACTIONS:
+        task = await fetch_task(user_id, message["task_id"])
+    stamp, summary = await asyncio.gather(
+        fetch_task_list_stamp(user_id), fetch_task_summary(user_id)
+    )
+    return event_payload(message, task, summary, task_list_version(user_id, stamp))
+
+
+async def async_stream(app, ctx, subscription: AsyncSubscription):
+    """
+    _stream() on the event loop, for the ASGI app: a waiting stream holds no
+    thread and no connection. Each event is handled in a copy of the stream's
+    request context `ctx` (templates build URLs), without the request hooks.
+    """
+    user_id = subscription.user_id
+    config = app.config
+    deadline = time.monotonic() + config["EVENTS_STREAM_SECONDS"]
+    app.extensions["task_events"].subscribe(subscription)
+    try:
+        with ctx.copy():
+            stamp = await fetch_task_list_stamp(user_id)
+        yield f"retry: {int(config['EVENTS_RETRY_MS'])}\n"
+        yield sse("hello", {"version": task_list_version(user_id, stamp)})
+        while time.monotonic() < deadline:
+            message = await subscription.get(config["EVENTS_HEARTBEAT"])
+            if subscription.overflowed:
+                yield sse("task", {"action": "reset"})
+                return
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            with ctx.copy():
+                payload = await _fetch_task_event(user_id, message)
+            yield sse("task", payload)
+    finally:
+        app.extensions["task_events"].unsubscribe(subscription)
+
+
+def task_events_url() -> str | None:
+    """
+    URL of the event stream for pages to connect to, None when not served.
+    """
+    app = current_app
+    if "task_events" not in app.extensions:
+        return None
+    if not (app.config["EVENTS_SYNC_STREAMS"] or "asgi" in app.extensions):
+        return None
+    return url_for("task_events")
+
+
+def init_events(app) -> None:
+    """
+    Add the /events Server-Sent Events stream of task changes.
+
+    Off by default. EVENTS_BACKEND "memory" only reaches streams of the same
+    process (a single worker); "postgres" fans out with LISTEN/NOTIFY, which
+    multi-worker setups like gunicorn.conf.py's need.
+
+    Streams are served by asgi.py, on the event loop (async_stream()). The
+    WSGI app only serves them with EVENTS_SYNC_STREAMS on: each one holds a
+    worker thread for up to EVENTS_STREAM_SECONDS, after which the browser
+    reconnects, so a few open tabs can take every thread of a worker.
+    """
+    backend = app.config["EVENTS_BACKEND"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EVENTS_BACKEND: {backend!r}")
+    app.add_template_global(task_events_url)
+    if backend == "off":
+        return
+    if backend == "postgres":
+        with app.app_context():
+            broker = PostgresBroker(db.engine)
+    else:
+        broker = LocalBroker()
+    app.extensions["task_events"] = broker
+
+    def task_events():
+        if not app.config["EVENTS_SYNC_STREAMS"]:
+            abort(404)
+        if g.get("user_id") is None:
+            abort(401)
+        # Events are read right after their change commits: not on a replica.
+        g.db_replica = None
+        subscription = Subscription(g.user_id, app.config["EVENTS_QUEUE_SIZE"])
+        broker.subscribe(subscription)
+        return Response(
+            stream_with_context(_stream(app, subscription)),
+            mimetype="text/event-stream",
+            headers=STREAM_HEADERS,
+        )
+
+    app.add_url_rule("/events", "task_events", task_events)
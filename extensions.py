@@ -1,3 +1,30 @@
+from flask import current_app, g, has_app_context
+from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select
 
-db = SQLAlchemy()
+
+class RoutingSession(Session):
+    """
+    Sends the SELECTs of a request routed to a read replica (g.db_replica,
+    see replicas.py) to that replica's engine. Everything else, including
+    SELECT ... FOR UPDATE and the queries of a flush, goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+            and has_app_context()
+        ):
+            replica = g.get("db_replica")
+            if replica is not None:
+                return current_app.extensions["replicas"].engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+migrate = Migrate()
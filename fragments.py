@@ -0,0 +1,82 @@
+# fragments.py
+from uuid import uuid4
+
+from cache import make_cache
+from flask import current_app, has_request_context, session
+from markupsafe import Markup
+
+
+def init_fragment_cache(app) -> None:
+    app.extensions["fragment_cache"] = make_cache(
+        app,
+        "fragment",
+        maxsize=app.config["FRAGMENT_CACHE_SIZE"],
+        ttl=app.config["FRAGMENT_CACHE_TTL"],
+    )
+
+
+def _task_list_version(cache, user_id: int) -> str:
+    version = cache.get(f"v:{user_id}")
+    if version is None:
+        # A fresh random token rather than a counter restarting at 0, so that
+        # fragments cached under an evicted version can never match again.
+        version = uuid4().hex[:12]
+        cache.set(f"v:{user_id}", version)
+    return version
+
+
+def bump_task_list(user_id: int) -> None:
+    """
+    Invalidate every cached task list fragment of the user.
+    """
+    version = uuid4().hex[:12]
+    current_app.extensions["fragment_cache"].set(f"v:{user_id}", version)
+    # Also carried in the session, so the user's next page view misses the
+    # cache even on a worker whose in-memory cache hasn't seen the bump.
+    # (CLI commands have no session; they rely on the shared backend.)
+    if has_request_context():
+        session["task_list_version"] = version
+
+
+def _task_list_key(cache, user_id: int, key_parts: tuple) -> str:
+    return ":".join(
+        [
+            "f",
+            str(user_id),
+            _task_list_version(cache, user_id),
+            session.get("task_list_version", ""),
+            *(str(part) for part in key_parts),
+        ]
+    )
+
+
+def cached_task_list(user_id: int, key_parts: tuple, render) -> Markup:
+    """
+    Return the task list HTML for `key_parts`, calling render() on a miss.
+    """
+    if not current_app.config["FRAGMENT_CACHE_ENABLED"]:
+        return Markup(render())
+
+    cache = current_app.extensions["fragment_cache"]
+    key = _task_list_key(cache, user_id, key_parts)
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html)
+    return Markup(html)
+
+
+async def cached_task_list_async(user_id: int, key_parts: tuple, render) -> Markup:
+    """
+    cached_task_list() for the async views: render() is a coroutine function.
+    """
+    if not current_app.config["FRAGMENT_CACHE_ENABLED"]:
+        return Markup(await render())
+
+    cache = current_app.extensions["fragment_cache"]
+    key = _task_list_key(cache, user_id, key_parts)
+    html = cache.get(key)
+    if html is None:
+        html = await render()
+        cache.set(key, html)
+    return Markup(html)
@@ -0,0 +1,44 @@
+# gunicorn.conf.py
+#
+# Production server settings, all overridable from the environment:
+#
+#     gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Send SIGHUP to the master for a graceful reload: new workers are started
+# with the current settings and old ones finish their in-flight requests
+# before exiting. With GUNICORN_PRELOAD on, the application code itself is
+# only re-imported by a full restart (or a USR2 + WINCH binary upgrade).
+import multiprocessing
+import os
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.environ.get(name, default).lower() in ("1", "true", "yes", "on")
+
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Import the app once in the master so workers fork with it already loaded.
+preload_app = _flag("GUNICORN_PRELOAD", "true")
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-") or None
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Pooled connections opened in the master must not be shared across forks.
+    if preload_app:
+        from extensions import db
+        from wsgi import app
+
+        with app.app_context():
+            db.engine.dispose(close=False)
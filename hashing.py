@@ -0,0 +1,81 @@
+# hashing.py
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the hashing pool already has its maximum of queued jobs."""
+
+
+class HashingPool:
+    """
+    Bounded executor for password hashing, kept off the request threads.
+
+    At most `workers` hashes run at once and `max_queue` more may wait; beyond
+    that run() fails fast with HashingBusy instead of piling up work.
+    """
+
+    def __init__(self, workers: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown hashing executor: {kind!r}")
+        self.workers = workers
+        self.kind = kind
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so that gunicorn workers don't inherit pool
+        # threads or processes from the master through fork().
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="pwhash"
+                    )
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def init_hashing(app) -> None:
+    app.extensions["password_hasher"] = HashingPool(
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_queue=app.config["PASSWORD_HASH_QUEUE"],
+        kind=app.config["PASSWORD_HASH_EXECUTOR"],
+    )
+
+
+def hash_password(password: str) -> str:
+    return current_app.extensions["password_hasher"].run(
+        generate_password_hash,
+        password,
+        current_app.config["PASSWORD_HASH_METHOD"],
+        current_app.config["PASSWORD_SALT_LENGTH"],
+    )
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return current_app.extensions["password_hasher"].run(
+        check_password_hash, password_hash, password
+    )
@@ -0,0 +1,64 @@
+# identity.py
+from dataclasses import dataclass
+
+from cache import make_cache
+from extensions import db
+from flask import current_app, g, has_app_context
+from models import User
+from sqlalchemy import event, select
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    The fields of the logged-in user that requests read, detached from any session.
+    """
+
+    id: int
+    username: str
+
+
+def init_user_cache(app) -> None:
+    app.extensions["user_cache"] = make_cache(
+        app,
+        "user",
+        maxsize=app.config["USER_CACHE_SIZE"],
+        ttl=app.config["USER_CACHE_TTL"],
+    )
+
+
+def load_user(user_id: int) -> CurrentUser | None:
+    cache = current_app.extensions["user_cache"]
+    cached = cache.get(user_id)
+    if cached is None:
+        row = db.session.execute(
+            select(User.id, User.username).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        cached = {"id": row.id, "username": row.username}
+        cache.set(user_id, cached)
+    return CurrentUser(**cached)
+
+
+def current_user() -> CurrentUser | None:
+    """
+    Resolve the logged-in user the first time a request asks for it.
+    """
+    if "_user" not in g:
+        user_id = g.get("user_id")
+        g._user = None if user_id is None else load_user(user_id)
+    return g._user
+
+
+def invalidate_user(user_id: int) -> None:
+    cache = current_app.extensions.get("user_cache")
+    if cache is not None:
+        cache.delete(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    if has_app_context():
+        invalidate_user(target.id)
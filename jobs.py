@@ -0,0 +1,355 @@
+# jobs.py
+import json
+import logging
+import math
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from counters import reconcile_counters
+from deletion import purge_deleted_tasks
+from extensions import db
+from flask import current_app
+from models import Job, _utcnow
+from ratelimit import SQLBuckets, parse_rate
+from reminders import send_due_digests
+from sessions import session_store
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+logger = logging.getLogger(__name__)
+
+# Job name -> handler, see job().
+HANDLERS = {}
+
+EPOCH = datetime(2000, 1, 3)  # a Monday at midnight
+
+
+def job(name: str):
+    """
+    Register the decorated function as the handler of the jobs called `name`.
+    """
+
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(
+    name: str,
+    payload: dict | None = None,
+    run_at: datetime | None = None,
+    key: str | None = None,
+    max_attempts: int | None = None,
+) -> int | None:
+    """
+    Add a job in the current transaction: it runs once that commits, so
+    enqueue it along with the change it follows. At most one job ever has
+    a given `key`; returns None instead of the id when it already exists.
+    """
+    values = {
+        "name": name,
+        "payload": json.dumps(payload or {}),
+        "key": key,
+        "status": "queued",
+        "run_at": run_at or _utcnow(),
+        "attempts": 0,
+        "max_attempts": max_attempts or current_app.config["JOB_MAX_ATTEMPTS"],
+    }
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    return db.session.scalar(
+        dialect.insert(Job)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=["key"])
+        .returning(Job.id)
+    )
+
+
+def claim_jobs(worker: str, limit: int) -> list:
+    """
+    Mark up to `limit` due jobs as running for `worker` and return them.
+
+    On PostgreSQL, FOR UPDATE SKIP LOCKED lets concurrent workers claim
+    different jobs without waiting on each other. SQLite has no row locks
+    (SQLAlchemy leaves the clause out) but runs one write at a time, and
+    the status check of the UPDATE keeps a job from being claimed twice.
+    """
+    now = _utcnow()
+    due = (
+        select(Job.id)
+        .where(Job.status == "queued", Job.run_at <= now)
+        .order_by(Job.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = db.session.execute(
+        update(Job)
+        .where(Job.id.in_(due), Job.status == "queued")
+        .values(
+            status="running",
+            locked_by=worker,
+            locked_at=now,
+            attempts=Job.attempts + 1,
+        )
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return claimed
+
+
+def retry_delay(attempts: int, backoff: float, max_delay: float) -> timedelta:
+    """
+    Exponential backoff: `backoff` seconds after the first failure, doubled
+    after each of the next ones, up to `max_delay`.
+    """
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1), max_delay))
+
+
+def _finish(job_row, worker: str, **values) -> None:
+    # Only while it is still ours: a job presumed dead may be running again.
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_row.id, Job.locked_by == worker, Job.status == "running")
+        .values(locked_by=None, locked_at=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def run_job(job_row, worker: str) -> bool:
+    """
+    Run a claimed job; on failure, requeue it with a backoff or give up on
+    it after its last attempt. Returns whether it succeeded.
+    """
+    config = current_app.config
+    handler = HANDLERS.get(job_row.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler for job {job_row.name!r}")
+        handler(**json.loads(job_row.payload))
+    except Exception as exc:
+        db.session.rollback()
+        logger.exception("Job %s (%s) failed", job_row.id, job_row.name)
+        values = {"last_error": f"{type(exc).__name__}: {exc}"}
+        if handler is None or job_row.attempts >= job_row.max_attempts:
+            values.update(status="failed", finished_at=_utcnow())
+        else:
+            delay = retry_delay(
+                job_row.attempts,
+                config["JOB_RETRY_BACKOFF"],
+                config["JOB_RETRY_MAX_DELAY"],
+            )
+            values.update(status="queued", run_at=_utcnow() + delay)
+        _finish(job_row, worker, **values)
+        return False
+    _finish(job_row, worker, status="done", finished_at=_utcnow(), last_error=None)
+    return True
+
+
+def requeue_stale_jobs(timeout: timedelta) -> int:
+    """
+    Give back jobs that have been running for longer than `timeout`: their
+    worker is presumed dead. Those out of attempts are failed instead.
+    """
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_at < _utcnow() - timeout)
+        .values(
+            status=case(
+                (Job.attempts >= Job.max_attempts, "failed"), else_="queued"
+            ),
+            locked_by=None,
+            locked_at=None,
+            last_error="Worker lost",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@dataclass(frozen=True)
+class Schedule:
+    """
+    Run the job `name` once every `every`, `at` into each period (e.g. every
+    day at 07:00). Times are UTC, like every timestamp in the database.
+    """
+
+    name: str
+    every: timedelta
+    at: timedelta = timedelta(0)
+
+    def slot(self, now: datetime) -> datetime:
+        """
+        The start of the current run period at `now`.
+        """
+        elapsed = (now - EPOCH - self.at) / self.every
+        return EPOCH + self.at + math.floor(elapsed) * self.every
+
+
+def schedules(app) -> list[Schedule]:
+    config = app.config
+    day = timedelta(days=1)
+    purge_interval = timedelta(seconds=config["JOB_PURGE_INTERVAL"])
+    result = [
+        Schedule("tasks.digest", day, timedelta(hours=config["TASK_DIGEST_HOUR"])),
+        Schedule("tasks.purge", purge_interval),
+        Schedule("sessions.gc", purge_interval),
+        Schedule("counters.reconcile", day, timedelta(hours=3)),
+        Schedule("jobs.cleanup", day, timedelta(hours=4)),
+    ]
+    if config["RATE_LIMIT_BACKEND"] == "sql":
+        result.append(Schedule("ratelimit.gc", purge_interval))
+    return result
+
+
+def enqueue_scheduled(schedule: Schedule, now: datetime) -> int | None:
+    """
+    Enqueue the current run of `schedule`, unless some worker already has.
+    """
+    slot = schedule.slot(now)
+    job_id = enqueue(
+        schedule.name,
+        {"scheduled_for": slot.isoformat()},
+        run_at=slot,
+        key=f"{schedule.name}@{slot.isoformat()}",
+    )
+    db.session.commit()
+    return job_id
+
+
+class Worker:
+    """
+    Claims due jobs and runs them on a pool of `concurrency` threads, each
+    in an app context of its own. Also enqueues the scheduled jobs and
+    requeues stale ones. SIGTERM or Ctrl-C stops claiming and lets the jobs
+    in progress finish.
+    """
+
+    def __init__(self, app, concurrency: int, schedule: bool = True):
+        self.app = app
+        self.concurrency = concurrency
+        self.schedules = schedules(app) if schedule else []
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self._slots = {}
+        self._next_stale_check = 0.0
+
+    def _run(self, job_row) -> bool:
+        with self.app.app_context():
+            try:
+                return run_job(job_row, self.name)
+            finally:
+                db.session.remove()
+
+    def _housekeeping(self) -> None:
+        now = _utcnow()
+        for schedule in self.schedules:
+            slot = schedule.slot(now)
+            # Only hit the database when a new period starts.
+            if self._slots.get(schedule.name) != slot:
+                enqueue_scheduled(schedule, now)
+                self._slots[schedule.name] = slot
+        lock_timeout = self.app.config["JOB_LOCK_TIMEOUT"]
+        if now.timestamp() >= self._next_stale_check:
+            requeue_stale_jobs(timedelta(seconds=lock_timeout))
+            self._next_stale_check = now.timestamp() + lock_timeout / 4
+
+    def run(self, poll: float = 1.0, once: bool = False) -> int:
+        """
+        Work until stopped or, with `once`, until no job is due. Returns the
+        number of jobs run.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+        done = 0
+        running = set()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="job") as pool:
+            try:
+                while not self.stopping.is_set():
+                    self._housekeeping()
+                    finished = {future for future in running if future.done()}
+                    running -= finished
+                    done += len(finished)
+
+                    free = self.concurrency - len(running)
+                    claimed = claim_jobs(self.name, free) if free else []
+                    running.update(pool.submit(self._run, row) for row in claimed)
+                    if once and not claimed and not running:
+                        break
+                    if claimed and len(running) < self.concurrency:
+                        continue  # there may be more due right away
+                    # Wait for a free thread, or for jobs to become due.
+                    if running:
+                        wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                    else:
+                        self.stopping.wait(poll)
+            except KeyboardInterrupt:
+                self.stopping.set()
+            finally:
+                db.session.remove()
+        return done + len(running)
+
+
+@job("tasks.digest")
+def _tasks_digest(scheduled_for: str) -> None:
+    # Sent in the morning about the next day.
+    day = datetime.fromisoformat(scheduled_for).date() + timedelta(days=1)
+    sent = send_due_digests(day, current_app.config["DIGEST_BATCH_SIZE"])
+    logger.info("Sent %d digests of tasks due %s", sent, day)
+
+
+@job("tasks.purge")
+def _tasks_purge(scheduled_for: str | None = None) -> None:
+    ttl = timedelta(seconds=current_app.config["DELETED_TASK_TTL"])
+    purge_deleted_tasks(ttl)
+
+
+@job("sessions.gc")
+def _sessions_gc(scheduled_for: str | None = None) -> None:
+    store = session_store(current_app)
+    if store is not None:
+        store.gc()
+
+
+@job("ratelimit.gc")
+def _ratelimit_gc(scheduled_for: str | None = None) -> None:
+    config = current_app.config
+    periods = [
+        parse_rate(config[name])[1]
+        for name in ("RATE_LIMIT_PER_IP", "RATE_LIMIT_PER_USERNAME")
+    ]
+    SQLBuckets().gc(max(periods))
+
+
+@job("counters.reconcile")
+def _counters_reconcile(scheduled_for: str | None = None) -> None:
+    reconcile_counters()
+
+
+@job("jobs.cleanup")
+def _jobs_cleanup(scheduled_for: str | None = None, batch_size: int = 1000) -> None:
+    # Done jobs are kept for JOB_RETENTION: their keys stop scheduled runs
+    # from being enqueued twice. Failed ones stay until looked into.
+    cutoff = _utcnow() - timedelta(seconds=current_app.config["JOB_RETENTION"])
+    while True:
+        old = (
+            select(Job.id)
+            .where(Job.status == "done", Job.run_at < cutoff)
+            .limit(batch_size)
+        )
+        count = db.session.execute(
+            delete(Job)
+            .where(Job.id.in_(old))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if count < batch_size:
+            return
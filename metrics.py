@@ -0,0 +1,359 @@
+# metrics.py
+import threading
+import time
+from bisect import bisect_left
+
+from extensions import db
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Seconds. The task pages should mostly land in the first few buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class PoolStats:
+    """
+    Counters filled by InstrumentedQueuePool, read by the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_timeout(self) -> None:
+        with self.lock:
+            self.timeouts += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that measures how long each checkout waits for a connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self._depth = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get() retries by calling itself; only time the outer call.
+        depth = getattr(self._depth, "value", 0)
+        if depth:
+            return super()._do_get()
+
+        self._depth.value = 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        finally:
+            self._depth.value = 0
+            self.stats.record_wait(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps the pool; keep the counters monotonic.
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with one series per tuple of label values.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self.series = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {labels: list(series) for labels, series in self.series.items()}
+
+
+class LabeledCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, labels: tuple, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.values)
+
+
+class RequestMetrics:
+    """
+    Per-endpoint request and SQL statistics of this process.
+    """
+
+    def __init__(self, slow_query_seconds: float):
+        self.slow_query_seconds = slow_query_seconds
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sql_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.requests = LabeledCounter()
+        self.sql_seconds = LabeledCounter()
+        self.slow_queries = LabeledCounter()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _counter_lines(lines, name, help_text, label_names, counter) -> None:
+    _header(lines, name, "counter", help_text)
+    for labels, value in sorted(counter.snapshot().items()):
+        lines.append(f"{name}{_labels(label_names, labels)} {value:g}")
+
+
+def _histogram_lines(lines, name, help_text, label_names, histogram) -> None:
+    _header(lines, name, "histogram", help_text)
+    for labels, series in sorted(histogram.snapshot().items()):
+        bounds = [f"{bound:g}" for bound in histogram.buckets] + ["+Inf"]
+        cumulative = 0
+        for bound, count in zip(bounds, series[:-1]):
+            cumulative += count
+            le = _labels(label_names, labels, f'le="{bound}"')
+            lines.append(f"{name}_bucket{le} {cumulative}")
+        lines.append(f"{name}_sum{_labels(label_names, labels)} {series[-1]:.6f}")
+        lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+
+
+def _metric(lines, name, kind, help_text, value):
+    _header(lines, name, kind, help_text)
+    lines.append(f"{name} {value}")
+
+
+def pool_metrics(lines: list) -> None:
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+
+    _metric(lines, "db_pool_size", "gauge", "Configured pool size.", pool.size())
+    _metric(
+        lines,
+        "db_pool_checked_out",
+        "gauge",
+        "Connections currently checked out.",
+        pool.checkedout(),
+    )
+    _metric(
+        lines,
+        "db_pool_overflow",
+        "gauge",
+        "Connections open beyond pool_size (negative while the pool fills up).",
+        pool.overflow(),
+    )
+
+    stats = getattr(pool, "stats", None)
+    if stats is None:
+        return
+    with stats.lock:
+        checkouts, waited = stats.checkouts, stats.wait_seconds
+        max_wait, timeouts = stats.max_wait_seconds, stats.timeouts
+    _metric(
+        lines,
+        "db_pool_checkouts_total",
+        "counter",
+        "Connections handed out by the pool.",
+        checkouts,
+    )
+    _metric(
+        lines,
+        "db_pool_checkout_wait_seconds_total",
+        "counter",
+        "Time spent waiting for a pooled connection.",
+        f"{waited:.6f}",
+    )
+    _metric(
+        lines,
+        "db_pool_checkout_wait_seconds_max",
+        "gauge",
+        "Longest wait for a pooled connection since start.",
+        f"{max_wait:.6f}",
+    )
+    _metric(
+        lines,
+        "db_pool_timeouts_total",
+        "counter",
+        "Checkouts that gave up after pool_timeout.",
+        timeouts,
+    )
+
+
+def request_metrics(lines: list, stats: RequestMetrics) -> None:
+    _counter_lines(
+        lines,
+        "http_requests_total",
+        "Requests handled, by endpoint, method and status.",
+        ("endpoint", "method", "status"),
+        stats.requests,
+    )
+    _histogram_lines(
+        lines,
+        "http_request_duration_seconds",
+        "Time to build the response, by endpoint.",
+        ("endpoint", "method"),
+        stats.latency,
+    )
+    _histogram_lines(
+        lines,
+        "http_request_sql_queries",
+        "SQL statements executed per request, by endpoint.",
+        ("endpoint",),
+        stats.sql_queries,
+    )
+    _counter_lines(
+        lines,
+        "http_request_sql_seconds_total",
+        "Time spent in SQL statements, by endpoint.",
+        ("endpoint",),
+        stats.sql_seconds,
+    )
+    _counter_lines(
+        lines,
+        "db_slow_queries_total",
+        "Statements slower than SLOW_QUERY_MS, by endpoint.",
+        ("endpoint",),
+        stats.slow_queries,
+    )
+
+
+def rate_limit_metrics(lines: list, limiter) -> None:
+    _counter_lines(
+        lines,
+        "rate_limit_requests_total",
+        "Sign-in attempts let through or refused with a 429, by endpoint.",
+        ("endpoint", "bucket", "outcome"),
+        limiter.counts,
+    )
+
+
+def _endpoint() -> str:
+    # The route name, never the path: unmatched URLs must not add series.
+    return request.endpoint or "none"
+
+
+def _instrument_engine(app, engine, stats: RequestMetrics) -> None:
+    logger = app.logger
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        in_request = has_request_context()
+        if in_request:
+            g.sql_queries = g.get("sql_queries", 0) + 1
+            g.sql_seconds = g.get("sql_seconds", 0.0) + elapsed
+        if elapsed >= stats.slow_query_seconds:
+            endpoint = _endpoint() if in_request else "none"
+            stats.slow_queries.inc((endpoint,))
+            # Statement only: parameters can hold user data.
+            logger.warning(
+                "Slow query (%.1f ms) in %s: %s",
+                elapsed * 1000,
+                endpoint,
+                " ".join(statement.split())[:1000],
+            )
+
+
+def instrument_engine(app, engine) -> None:
+    """
+    Time the statements of another engine (e.g. the async one's sync_engine)
+    into the same per-request figures.
+    """
+    if app.config["METRICS_ENABLED"]:
+        _instrument_engine(app, engine, app.extensions["request_metrics"])
+
+
+def init_metrics(app) -> None:
+    """
+    Add /metrics and, unless METRICS_ENABLED is off, time every request and
+    every SQL statement. The cost is a few perf_counter() calls and dict
+    updates per request; nothing is allocated per statement.
+    """
+    stats = RequestMetrics(app.config["SLOW_QUERY_MS"] / 1000)
+    app.extensions["request_metrics"] = stats
+
+    def metrics():
+        lines = []
+        pool_metrics(lines)
+        request_metrics(lines, stats)
+        limiter = app.extensions.get("rate_limiter")
+        if limiter is not None:
+            rate_limit_metrics(lines, limiter)
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
+
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    with app.app_context():
+        # Creating the engines opens no connection.
+        for engine in db.engines.values():
+            instrument_engine(app, engine)
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = _endpoint()
+        queries, sql_seconds = g.get("sql_queries", 0), g.get("sql_seconds", 0.0)
+        stats.requests.inc((endpoint, request.method, response.status_code))
+        stats.latency.observe((endpoint, request.method), elapsed)
+        stats.sql_queries.observe((endpoint,), queries)
+        stats.sql_seconds.inc((endpoint,), sql_seconds)
+        response.headers["Server-Timing"] = (
+            f'db;dur={sql_seconds * 1000:.1f};desc="{queries} queries", '
+            f"app;dur={elapsed * 1000:.1f}"
+        )
+        return response
@@ -1,9 +1,9 @@
 # migrate.py
 from app import create_app
-from extensions import db
+from flask_migrate import upgrade
 
 app = create_app()
 
 with app.app_context():
-    db.create_all()
-    print("Database created.")
+    upgrade()
+    print("Database migrated.")
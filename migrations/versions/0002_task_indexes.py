@@ -0,0 +1,51 @@
+"""composite indexes for the hot task queries
+
+- ix_tasks_user_due: index() with status=all, ordered by (due_date, id).
+- ix_tasks_user_completed_due: index() with status=open/done.
+- ix_tasks_user_open_due: partial index over open tasks only.
+
+edit_task, toggle_task and delete_task look tasks up by primary key and then
+check user_id on that single row, so the primary key already serves them.
+
+Revision ID: 0002_task_indexes
+Revises: 0001_initial
+Create Date: 2026-10-17 09:30:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0002_task_indexes"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_tasks_user_due",
+        "tasks",
+        ["user_id", "due_date", "id"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_tasks_user_completed_due",
+        "tasks",
+        ["user_id", "is_completed", "due_date", "id"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_tasks_user_open_due",
+        "tasks",
+        ["user_id", "due_date", "id"],
+        postgresql_where=sa.text("NOT is_completed"),
+        sqlite_where=sa.text("is_completed = 0"),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_tasks_user_open_due", table_name="tasks")
+    op.drop_index("ix_tasks_user_completed_due", table_name="tasks")
+    op.drop_index("ix_tasks_user_due", table_name="tasks")
@@ -0,0 +1,32 @@
+"""tasks.updated_at for conditional GET
+
+Existing rows start from their creation time. The value is maintained by the
+application (see models._utcnow), so no server default is kept.
+
+Revision ID: 0003_task_updated_at
+Revises: 0002_task_indexes
+Create Date: 2026-10-17 11:00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003_task_updated_at"
+down_revision = "0002_task_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("tasks", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE tasks SET updated_at = created_at")
+    with op.batch_alter_table("tasks") as batch:
+        batch.alter_column("updated_at", existing_type=sa.DateTime(), nullable=False)
+    op.create_index("ix_tasks_user_updated", "tasks", ["user_id", "updated_at"])
+
+
+def downgrade():
+    op.drop_index("ix_tasks_user_updated", table_name="tasks")
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_column("updated_at")
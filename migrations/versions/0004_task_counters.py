@@ -0,0 +1,50 @@
+"""per-user task counters
+
+Backfilled from the tasks table. overdue_as_of starts NULL so the overdue
+count is computed on first read.
+
+Revision ID: 0004_task_counters
+Revises: 0003_task_updated_at
+Create Date: 2026-10-17 12:00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0004_task_counters"
+down_revision = "0003_task_updated_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "task_counters",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("open_count", sa.Integer(), nullable=False),
+        sa.Column("done_count", sa.Integer(), nullable=False),
+        sa.Column("overdue_count", sa.Integer(), nullable=False),
+        sa.Column("overdue_as_of", sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO task_counters
+            (user_id, open_count, done_count, overdue_count, overdue_as_of)
+        SELECT
+            u.id,
+            (SELECT COUNT(*) FROM tasks t
+              WHERE t.user_id = u.id AND NOT t.is_completed),
+            (SELECT COUNT(*) FROM tasks t
+              WHERE t.user_id = u.id AND t.is_completed),
+            0,
+            NULL
+        FROM users u
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("task_counters")
@@ -0,0 +1,41 @@
+"""full-text search index on tasks
+
+PostgreSQL only: a GIN index over the weighted tsvector of title and
+description (models.search_document). Built CONCURRENTLY so that existing
+tables stay writable while it is created. SQLite searches with LIKE and
+gets no index.
+
+Revision ID: 0005_task_search
+Revises: 0004_task_counters
+Create Date: 2026-10-17 13:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0005_task_search"
+down_revision = "0004_task_counters"
+branch_labels = None
+depends_on = None
+
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')"
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_search "
+            f"ON tasks USING gin (({SEARCH_DOCUMENT}))"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_tasks_search")
@@ -0,0 +1,42 @@
+"""soft delete of tasks
+
+tasks.deleted_at is NULL for live tasks. The new column has no default, so
+adding it rewrites nothing on PostgreSQL. The partial index only covers
+soft-deleted rows, for `flask tasks purge`; it is built CONCURRENTLY there.
+
+Revision ID: 0007_task_soft_delete
+Revises: 0006_sessions
+Create Date: 2026-10-17 15:00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0007_task_soft_delete"
+down_revision = "0006_sessions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("tasks", sa.Column("deleted_at", sa.DateTime(), nullable=True))
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_deleted_at "
+                "ON tasks (deleted_at) WHERE deleted_at IS NOT NULL"
+            )
+    else:
+        op.create_index(
+            "ix_tasks_deleted_at",
+            "tasks",
+            ["deleted_at"],
+            sqlite_where=sa.text("deleted_at IS NOT NULL"),
+        )
+
+
+def downgrade():
+    op.drop_index("ix_tasks_deleted_at", table_name="tasks")
+    with op.batch_alter_table("tasks") as batch:
+        batch.drop_column("deleted_at")
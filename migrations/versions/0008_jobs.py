@@ -0,0 +1,60 @@
+"""background jobs
+
+The jobs table of `flask jobs worker`, and the partial index of open tasks
+by due date that the due-tomorrow digest scans. That one is built
+CONCURRENTLY on PostgreSQL.
+
+Revision ID: 0008_jobs
+Revises: 0007_task_soft_delete
+Create Date: 2026-10-17 16:00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0008_jobs"
+down_revision = "0007_task_soft_delete"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=100), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("key", sa.String(length=200), nullable=True),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("run_at", sa.DateTime(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("locked_by", sa.String(length=100), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("key"),
+    )
+    op.create_index("ix_jobs_status_run_at", "jobs", ["status", "run_at"])
+
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tasks_open_due_user "
+                "ON tasks (due_date, user_id, id) WHERE NOT is_completed"
+            )
+    else:
+        op.create_index(
+            "ix_tasks_open_due_user",
+            "tasks",
+            ["due_date", "user_id", "id"],
+            sqlite_where=sa.text("is_completed = 0"),
+        )
+
+
+def downgrade():
+    op.drop_index("ix_tasks_open_due_user", table_name="tasks")
+    op.drop_index("ix_jobs_status_run_at", table_name="jobs")
+    op.drop_table("jobs")
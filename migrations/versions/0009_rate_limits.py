@@ -0,0 +1,33 @@
+"""rate limit buckets
+
+Used when RATE_LIMIT_BACKEND=sql.
+
+Revision ID: 0009_rate_limits
+Revises: 0008_jobs
+Create Date: 2026-10-17 17:00:00
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0009_rate_limits"
+down_revision = "0008_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "rate_limits",
+        sa.Column("key", sa.String(length=100), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index("ix_rate_limits_updated_at", "rate_limits", ["updated_at"])
+
+
+def downgrade():
+    op.drop_index("ix_rate_limits_updated_at", table_name="rate_limits")
+    op.drop_table("rate_limits")
@@ -1,9 +1,58 @@
 # models.py
-from datetime import date
+from datetime import UTC, date, datetime
+from functools import lru_cache
 
 from extensions import db
+from flask import g, has_app_context
+from sqlalchemy.ext.hybrid import hybrid_method
 from werkzeug.security import check_password_hash, generate_password_hash
 
+# The task list filters of Task.list_filter().
+STATUS_FILTERS = ("all", "open", "done", "overdue")
+
+
+def _utcnow() -> datetime:
+    # Set from Python rather than the database's now(): SQLite's
+    # CURRENT_TIMESTAMP only has one-second resolution.
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def request_today() -> date:
+    """
+    Today's date, read once per request (or app context): every overdue check
+    of a page agrees, even when it is rendered across midnight.
+    """
+    if not has_app_context():
+        return date.today()
+    if "today" not in g:
+        g.today = date.today()
+    return g.today
+
+
+def search_document(title, description):
+    """
+    The weighted tsvector searched on PostgreSQL: title words rank above
+    description words. Must stay identical to the ix_tasks_search expression.
+    """
+    # Constants are inlined rather than bound, so the query's expression is
+    # the indexed one token for token.
+    english, empty = db.text("'english'::regconfig"), db.text("''")
+    return db.func.setweight(
+        db.func.to_tsvector(english, db.func.coalesce(title, empty)), db.text("'A'")
+    ).op("||")(
+        db.func.setweight(
+            db.func.to_tsvector(english, db.func.coalesce(description, empty)),
+            db.text("'B'"),
+        )
+    )
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method: str) -> str:
+    # The "method:params" part werkzeug writes, with its defaults filled in
+    # (e.g. "scrypt" -> "scrypt:32768:8:1").
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
 
 class User(db.Model):
     __tablename__ = "users"
@@ -12,30 +61,218 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
 
-    tasks = db.relationship(
-        "Task", backref="user", lazy=True, cascade="all, delete-orphan"
-    )
+    # No delete cascade: deletion.delete_user() removes the tasks with one
+    # DELETE instead of loading and deleting them row by row.
+    tasks = db.relationship("Task", backref="user", lazy=True, passive_deletes="all")
 
-    def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+    def set_password(
+        self, password: str, method: str = "scrypt", salt_length: int = 16
+    ) -> None:
+        self.password_hash = generate_password_hash(
+            password, method=method, salt_length=salt_length
+        )
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self, method: str, salt_length: int | None = None) -> bool:
+        """
+        True when the stored hash wasn't made with `method` and its parameters,
+        or, when `salt_length` is given, with a salt of another length.
+        """
+        # werkzeug's format: "method:params$salt$hash".
+        parts = self.password_hash.split("$", 2)
+        if parts[0] != _hash_prefix(method):
+            return True
+        return salt_length is not None and (
+            len(parts) != 3 or len(parts[1]) != salt_length
+        )
+
 
 class Task(db.Model):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # index() with status=all: user's tasks in (due_date, id) keyset order.
+        db.Index("ix_tasks_user_due", "user_id", "due_date", "id"),
+        # index() with status=open/done.
+        db.Index(
+            "ix_tasks_user_completed_due", "user_id", "is_completed", "due_date", "id"
+        ),
+        # Open tasks are the default working set; keep a smaller index just for them.
+        db.Index(
+            "ix_tasks_user_open_due",
+            "user_id",
+            "due_date",
+            "id",
+            postgresql_where=db.text("NOT is_completed"),
+            sqlite_where=db.text("is_completed = 0"),
+        ),
+        # MAX(updated_at) per user for the task list ETag.
+        db.Index("ix_tasks_user_updated", "user_id", "updated_at"),
+        # The due-date digest: every user's open tasks due on a given day.
+        db.Index(
+            "ix_tasks_open_due_user",
+            "due_date",
+            "user_id",
+            "id",
+            postgresql_where=db.text("NOT is_completed"),
+            sqlite_where=db.text("is_completed = 0"),
+        ),
+        # The purge only looks at the (few) soft-deleted rows.
+        db.Index(
+            "ix_tasks_deleted_at",
+            "deleted_at",
+            postgresql_where=db.text("deleted_at IS NOT NULL"),
+            sqlite_where=db.text("deleted_at IS NOT NULL"),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=_utcnow, onupdate=_utcnow, nullable=False
+    )
     due_date = db.Column(db.Date, nullable=True)
     is_completed = db.Column(db.Boolean, default=False, nullable=False)
+    # Set by a delete, cleared by an undo; purged for good after DELETED_TASK_TTL.
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
-    def is_overdue(self) -> bool:
+    @classmethod
+    def list_filter(
+        cls, user_id: int, status_filter: str = "all", today: date | None = None
+    ) -> list:
+        """
+        WHERE criteria of the user's tasks, narrowed by the All/Open/Done/
+        Overdue filter of the task list. Deleted tasks are left out.
+        """
+        criteria = [cls.user_id == user_id, cls.deleted_at.is_(None)]
+        if status_filter == "open":
+            # Matches the predicate of the partial ix_tasks_user_open_due index.
+            criteria.append(~cls.is_completed)
+        elif status_filter == "done":
+            criteria.append(cls.is_completed == db.true())
+        elif status_filter == "overdue":
+            criteria.append(cls.is_overdue(today))
+        return criteria
+
+    @classmethod
+    def query_for(
+        cls, user_id: int, status_filter: str = "all", today: date | None = None
+    ):
+        """
+        The user's tasks as a Query, see list_filter().
+        """
+        return cls.query.filter(*cls.list_filter(user_id, status_filter, today))
+
+    @hybrid_method
+    def is_overdue(self, today: date | None = None) -> bool:
         if self.is_completed or self.due_date is None:
             return False
-        return self.due_date < date.today()
+        return self.due_date < (today or request_today())
+
+    @is_overdue.inplace.expression
+    @classmethod
+    def _is_overdue_expression(cls, today: date | None = None):
+        # Open and due before today: with user_id, a range scan of the
+        # partial ix_tasks_user_open_due index, already in (due_date, id) order.
+        # NULL due dates drop out of the comparison.
+        return db.and_(~cls.is_completed, cls.due_date < (today or request_today()))
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "due_date": self.due_date.isoformat() if self.due_date else None,
+            "is_completed": self.is_completed,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+# Full-text search on PostgreSQL. An expression index rather than a stored
+# tsvector column: nothing extra to keep in sync on writes, and SQLite (which
+# searches with LIKE instead) doesn't get the index at all.
+db.Index(
+    "ix_tasks_search",
+    search_document(Task.title, Task.description),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+
+class TaskCounter(db.Model):
+    """
+    Per-user task counts, updated by the task mutations in their transaction.
+
+    overdue_count depends on the date: it is only valid for overdue_as_of,
+    and NULL there means a mutation touched an overdue task since.
+    """
+
+    __tablename__ = "task_counters"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    open_count = db.Column(db.Integer, default=0, nullable=False)
+    done_count = db.Column(db.Integer, default=0, nullable=False)
+    overdue_count = db.Column(db.Integer, default=0, nullable=False)
+    overdue_as_of = db.Column(db.Date, nullable=True)
+
+
+class SessionRecord(db.Model):
+    """
+    Server-side session (SESSION_BACKEND=sql), looked up by the cookie's id.
+    """
+
+    __tablename__ = "sessions"
+
+    id = db.Column(db.String(32), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    # Lets all sessions of a user be revoked at once.
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class Job(db.Model):
+    """
+    Background work for `flask jobs worker` (jobs.py): the handler `name` is
+    called with the JSON `payload` as keyword arguments.
+
+    status goes queued -> running -> done, or back to queued with a later
+    run_at for a retry, or to failed after max_attempts. `key` is unique:
+    scheduled jobs use it so that each run is enqueued once, whichever
+    worker gets there first.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Claiming the queued jobs that are due, and finding stale running ones.
+        db.Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")
+    key = db.Column(db.String(200), nullable=True, unique=True)
+    status = db.Column(db.String(16), nullable=False, default="queued")
+    run_at = db.Column(db.DateTime, nullable=False, default=_utcnow)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+
+class RateLimitBucket(db.Model):
+    """
+    Token bucket of RATE_LIMIT_BACKEND=sql (ratelimit.py). updated_at is in
+    epoch seconds, so that refills are plain arithmetic in SQL.
+    """
+
+    __tablename__ = "rate_limits"
+
+    key = db.Column(db.String(100), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
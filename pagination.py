@@ -0,0 +1,135 @@
+# pagination.py
+import base64
+import binascii
+import json
+from dataclasses import dataclass, field
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+@dataclass
+class Page:
+    items: list = field(default_factory=list)
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+
+def encode_cursor(direction: str, sort_value: date | None, item_id: int) -> str:
+    """
+    Build an opaque cursor pointing after ("n") or before ("p") a row.
+    """
+    payload = [direction, sort_value.isoformat() if sort_value else None, item_id]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str) -> tuple[str, date | None, int]:
+    """
+    Reverse of encode_cursor(). Raises InvalidCursor on any malformed input.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        direction, sort_value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ("n", "p") or not isinstance(item_id, int):
+            raise ValueError(direction)
+        if sort_value is not None:
+            sort_value = date.fromisoformat(sort_value)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as exc:
+        raise InvalidCursor(token) from exc
+    return direction, sort_value, item_id
+
+
+def page_size(requested: int | None) -> int:
+    """
+    The requested page size, or TASKS_PER_PAGE, capped by TASKS_MAX_PER_PAGE.
+    """
+    if requested is None:
+        return current_app.config["TASKS_PER_PAGE"]
+    return max(1, min(requested, current_app.config["TASKS_MAX_PER_PAGE"]))
+
+
+def _after(sort_col, id_col, sort_value, item_id):
+    # Rows strictly after (sort_value, item_id) in "sort ASC NULLS LAST, id ASC".
+    if sort_value is None:
+        return and_(sort_col.is_(None), id_col > item_id)
+    return or_(
+        sort_col > sort_value,
+        and_(sort_col == sort_value, id_col > item_id),
+        sort_col.is_(None),
+    )
+
+
+def _before(sort_col, id_col, sort_value, item_id):
+    # Rows strictly before (sort_value, item_id) in the same ordering.
+    if sort_value is None:
+        return or_(sort_col.isnot(None), and_(sort_col.is_(None), id_col < item_id))
+    return or_(
+        sort_col < sort_value,
+        and_(sort_col == sort_value, id_col < item_id),
+    )
+
+
+def keyset_window(query, sort_col, id_col, cursor: str | None, per_page: int):
+    """
+    Narrow `query` (a Query or a select()) to the page `cursor` points at:
+    the keyset WHERE clause, the ordering and a LIMIT of per_page + 1.
+    Returns the query and the cursor's direction.
+    """
+    direction, sort_value, item_id = "n", None, None
+    if cursor:
+        direction, sort_value, item_id = decode_cursor(cursor)
+
+    if direction == "n":
+        if item_id is not None:
+            query = query.filter(_after(sort_col, id_col, sort_value, item_id))
+        query = query.order_by(sort_col.asc().nullslast(), id_col.asc())
+    else:
+        query = query.filter(_before(sort_col, id_col, sort_value, item_id))
+        query = query.order_by(sort_col.desc().nullsfirst(), id_col.desc())
+    return query.limit(per_page + 1), direction
+
+
+def keyset_page(
+    rows: list, sort_col, id_col, cursor: str | None, direction: str, per_page: int
+) -> Page:
+    """
+    Build the Page of the rows fetched with keyset_window().
+    """
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == "p":
+        rows.reverse()
+
+    page = Page(items=rows)
+    if rows:
+        first, last = rows[0], rows[-1]
+        first_key = (getattr(first, sort_col.key), getattr(first, id_col.key))
+        last_key = (getattr(last, sort_col.key), getattr(last, id_col.key))
+        if direction == "n":
+            if has_more:
+                page.next_cursor = encode_cursor("n", *last_key)
+            if cursor:
+                page.prev_cursor = encode_cursor("p", *first_key)
+        else:
+            page.next_cursor = encode_cursor("n", *last_key)
+            if has_more:
+                page.prev_cursor = encode_cursor("p", *first_key)
+    return page
+
+
+def keyset_paginate(query, sort_col, id_col, cursor: str | None, per_page: int):
+    """
+    Fetch one page of `query` ordered by (sort_col ASC NULLS LAST, id_col ASC).
+
+    The page is located with a WHERE clause on the last/first row seen instead
+    of an OFFSET, so every page costs the same regardless of its depth.
+    """
+    query, direction = keyset_window(query, sort_col, id_col, cursor, per_page)
+    return keyset_page(query.all(), sort_col, id_col, cursor, direction, per_page)
@@ -0,0 +1,110 @@
+# query_budget.py
+from extensions import db
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+MODES = ("off", "warn", "raise")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in "raise" mode by the statement that broke the request's budget."""
+
+
+def query_budget(limit: int | None):
+    """
+    Give a view its own query budget; None exempts it (e.g. batched imports).
+    A QUERY_BUDGETS entry for the endpoint still takes precedence.
+    """
+
+    def decorate(view):
+        view.query_budget = limit
+        return view
+
+    return decorate
+
+
+def parse_budgets(raw: str) -> dict:
+    """
+    "index=8,api_v1.import_tasks_file=0" -> {"index": 8, "api_v1...": None}.
+    A budget of 0 means no budget.
+    """
+    budgets = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        endpoint, _, limit = item.partition("=")
+        budgets[endpoint.strip()] = int(limit) or None
+    return budgets
+
+
+class _RequestQueries:
+    __slots__ = ("limit", "count", "selects", "tripped")
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.selects = {}
+        self.tripped = False
+
+
+def _budget_for(app, endpoint) -> int | None:
+    if endpoint in app.config["QUERY_BUDGETS"]:
+        return app.config["QUERY_BUDGETS"][endpoint]
+    view = app.view_functions.get(endpoint)
+    if view is not None and hasattr(view, "query_budget"):
+        return view.query_budget
+    return app.config["QUERY_BUDGET_DEFAULT"]
+
+
+def _trip(app, state: _RequestQueries, problem: str, statement: str) -> None:
+    message = f"{request.method} {request.path} ({request.endpoint}): {problem}"
+    if app.config["QUERY_BUDGET_MODE"] == "raise":
+        raise QueryBudgetExceeded(f"{message}\n{statement}")
+    # Once per request: the rest of a runaway loop would only repeat it.
+    if not state.tripped:
+        state.tripped = True
+        app.logger.warning("Query budget exceeded: %s: %s", message, statement)
+
+
+def _check(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    app = current_app._get_current_object()
+    if app.config["QUERY_BUDGET_MODE"] == "off":
+        return
+
+    state = g.get("request_queries")
+    if state is None:
+        state = g.request_queries = _RequestQueries(
+            _budget_for(app, request.endpoint)
+        )
+    state.count += 1
+    if state.limit is not None and state.count > state.limit:
+        _trip(app, state, f"{state.count} queries, budget {state.limit}", statement)
+
+    # N+1: one SELECT re-run with different parameters for every row of a list.
+    if context.isinsert or context.isupdate or context.isdelete:
+        return
+    repeats = state.selects[statement] = state.selects.get(statement, 0) + 1
+    if repeats > app.config["QUERY_REPEAT_LIMIT"]:
+        _trip(app, state, f"same SELECT run {repeats} times (N+1?)", statement)
+
+
+def watch_engine(engine) -> None:
+    """
+    Count the statements of another engine against the request's budget.
+    """
+    event.listen(engine, "after_cursor_execute", _check)
+
+
+def init_query_budget(app) -> None:
+    """
+    Count the statements of each request against its budget.
+
+    QUERY_BUDGET_MODE "warn" logs the first overrun of a request, "raise"
+    fails the request (used by the tests), "off" skips the check.
+    """
+    mode = app.config["QUERY_BUDGET_MODE"]
+    if mode not in MODES:
+        raise ValueError(f"Unknown QUERY_BUDGET_MODE: {mode!r}")
+    with app.app_context():
+        for engine in db.engines.values():
+            watch_engine(engine)
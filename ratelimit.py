@@ -0,0 +1,172 @@
+# ratelimit.py
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from extensions import db
+from flask import current_app, request
+from metrics import LabeledCounter
+from models import RateLimitBucket
+from sqlalchemy import case, delete, literal
+from sqlalchemy.dialects import postgresql, sqlite
+
+BACKENDS = ("memory", "sql", "off")
+
+
+class RateLimited(Exception):
+    """Raised when a request has used up one of its buckets."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+def parse_rate(value: str) -> tuple[int, float]:
+    """
+    "20/60" -> a bucket of 20 tokens, refilled from empty in 60 seconds.
+    """
+    capacity, _, period = value.partition("/")
+    capacity, period = int(capacity), float(period or 60)
+    if capacity < 1 or period <= 0:
+        raise ValueError(f"Invalid rate: {value!r}")
+    return capacity, period
+
+
+class MemoryBuckets:
+    """
+    Token buckets of this process, the least recently used dropped beyond
+    `maxsize` (a dropped bucket is simply full again).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        """
+        Take a token from the bucket `key`. Returns 0.0 when one was left,
+        otherwise the seconds until there is one.
+        """
+        now = time.monotonic()
+        rate = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return 0.0
+
+
+class SQLBuckets:
+    """
+    Token buckets in the rate_limits table, shared by every worker. Each take
+    is one upsert on a connection of its own, so it never commits the
+    request's session: it refills and takes a token in the same statement,
+    or leaves the row alone (and returns nothing) when the bucket is empty.
+    """
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        now = time.time()
+        rate = capacity / period
+        dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(RateLimitBucket).values(
+            key=key, tokens=capacity - 1, updated_at=now
+        )
+        refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate
+        refilled = case((refilled > capacity, literal(float(capacity))), else_=refilled)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"tokens": refilled - 1, "updated_at": now},
+            where=refilled >= 1,
+        ).returning(RateLimitBucket.key)
+        with db.engine.begin() as conn:
+            allowed = conn.execute(stmt).first() is not None
+        # Without the row's state, the wait for a whole token is an upper bound.
+        return 0.0 if allowed else 1 / rate
+
+    def gc(self, max_period: float) -> int:
+        """
+        Delete the buckets full again by now: they are the same as no row.
+        """
+        with db.engine.begin() as conn:
+            return conn.execute(
+                delete(RateLimitBucket).where(
+                    RateLimitBucket.updated_at < time.time() - max_period
+                )
+            ).rowcount
+
+
+class RateLimiter:
+    def __init__(self, buckets, per_ip: tuple, per_username: tuple):
+        self.buckets = buckets
+        self.per_ip = per_ip
+        self.per_username = per_username
+        # (endpoint, bucket, outcome) -> requests, shown on /metrics.
+        self.counts = LabeledCounter()
+
+    def check(self, endpoint: str, address: str | None, username: str) -> None:
+        """
+        Take a token from the endpoint's buckets of the client address and of
+        the username; raise RateLimited if either was empty.
+        """
+        # Usernames are hashed: keys stay short and the table holds no names.
+        digest = hashlib.blake2b(username.lower().encode(), digest_size=16)
+        for bucket, key, (capacity, period) in (
+            ("ip", f"{endpoint}:ip:{address}", self.per_ip),
+            ("username", f"{endpoint}:user:{digest.hexdigest()}", self.per_username),
+        ):
+            wait = self.buckets.take(key, capacity, period)
+            if wait:
+                self.counts.inc((endpoint, bucket, "limited"))
+                raise RateLimited(wait)
+        self.counts.inc((endpoint, "all", "allowed"))
+
+
+def check_rate_limit(endpoint: str, username: str) -> None:
+    """
+    Throttle sign-in attempts for `username` from the current client. Call
+    it before anything is queried or hashed for the attempt.
+    """
+    limiter = current_app.extensions.get("rate_limiter")
+    if limiter is not None:
+        limiter.check(endpoint, request.remote_addr, username)
+
+
+def init_rate_limits(app) -> None:
+    """
+    Token buckets on login and registration attempts, per client address
+    (RATE_LIMIT_PER_IP) and per username (RATE_LIMIT_PER_USERNAME), both
+    "<attempts>/<seconds>". RATE_LIMIT_BACKEND "memory" counts per process,
+    "sql" in the rate_limits table for all workers; "off" disables them.
+
+    Behind a reverse proxy, remote_addr must be the client's (ProxyFix),
+    or every client shares the proxy's bucket.
+    """
+    backend = app.config["RATE_LIMIT_BACKEND"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend!r}")
+
+    @app.errorhandler(RateLimited)
+    def rate_limited(exc):
+        retry_after = max(1, math.ceil(exc.retry_after))
+        message = f"Too many attempts, retry in {retry_after} seconds."
+        return message, 429, {"Retry-After": str(retry_after)}
+
+    if backend == "off":
+        return
+    if backend == "memory":
+        buckets = MemoryBuckets(app.config["RATE_LIMIT_MEMORY_SIZE"])
+    else:
+        buckets = SQLBuckets()
+    app.extensions["rate_limiter"] = RateLimiter(
+        buckets,
+        parse_rate(app.config["RATE_LIMIT_PER_IP"]),
+        parse_rate(app.config["RATE_LIMIT_PER_USERNAME"]),
+    )
@@ -0,0 +1,72 @@
+# reminders.py
+import logging
+from datetime import date
+
+from extensions import db
+from models import Task
+from sqlalchemy import and_, or_, select
+
+logger = logging.getLogger(__name__)
+
+
+def tasks_due_on(day: date, batch_size: int = 1000):
+    """
+    Yield (user_id, [(task_id, title), ...]) for every user with open tasks
+    due on `day`. Reads `batch_size` rows at a time in (user_id, id) keyset
+    order from ix_tasks_open_due_user, so no batch repeats or skips a row
+    and each one is a short range scan.
+    """
+    user_id, tasks = None, []
+    last = None
+    while True:
+        stmt = (
+            select(Task.user_id, Task.id, Task.title)
+            .where(
+                Task.due_date == day,
+                ~Task.is_completed,
+                Task.deleted_at.is_(None),
+            )
+            .order_by(Task.user_id, Task.id)
+            .limit(batch_size)
+        )
+        if last is not None:
+            stmt = stmt.where(
+                or_(
+                    Task.user_id > last[0],
+                    and_(Task.user_id == last[0], Task.id > last[1]),
+                )
+            )
+        rows = db.session.execute(stmt).all()
+        for row in rows:
+            if row.user_id != user_id:
+                if tasks:
+                    yield user_id, tasks
+                user_id, tasks = row.user_id, []
+            tasks.append((row.id, row.title))
+        if len(rows) < batch_size:
+            break
+        last = (rows[-1].user_id, rows[-1].id)
+        # Nothing is written: don't keep a snapshot open between batches.
+        db.session.commit()
+    if tasks:
+        yield user_id, tasks
+
+
+def deliver_digest(user_id: int, day: date, tasks: list) -> None:
+    # There is no mail integration yet: the digest goes to the log.
+    titles = ", ".join(title for _, title in tasks)
+    logger.info(
+        "Digest for user %s: %d task(s) due %s: %s", user_id, len(tasks), day, titles
+    )
+
+
+def send_due_digests(day: date, batch_size: int = 1000) -> int:
+    """
+    Send every user with open tasks due on `day` one digest of them.
+    Returns the number of digests sent.
+    """
+    sent = 0
+    for user_id, tasks in tasks_due_on(day, batch_size):
+        deliver_digest(user_id, day, tasks)
+        sent += 1
+    return sent
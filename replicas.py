@@ -0,0 +1,149 @@
+# replicas.py
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from extensions import db
+from flask import g, request, session
+from metrics import instrument_engine
+from query_budget import watch_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Requests whose reads may be served by a replica.
+READ_METHODS = ("GET", "HEAD")
+
+
+def replica_configs(urls: list[str], engine_options) -> dict:
+    """
+    Name -> engine settings of the replica URLs, with the same pool options
+    as the primary (see _build_engine_options() in app.py).
+
+    They are not SQLALCHEMY_BINDS: Flask-SQLAlchemy would register metadata
+    for each bind on the shared `db`, and so on every later app of the
+    process, and create_all()/drop_all() would run against the replicas.
+    """
+    return {
+        f"replica_{index}": {"url": url, "options": engine_options(url)}
+        for index, url in enumerate(urls)
+    }
+
+
+class ReplicaSet:
+    """
+    The replica engines, picked in turn, skipping those that failed in the
+    last `retry_after` seconds.
+    """
+
+    def __init__(self, engines: dict, retry_after: float):
+        self.engines = engines
+        self.keys = list(engines)
+        self.retry_after = retry_after
+        self._down_until = {}
+        self._next = itertools.cycle(self.keys)
+        self._lock = threading.Lock()
+
+    def pick(self) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            for _ in self.keys:
+                key = next(self._next)
+                if self._down_until.get(key, 0.0) <= now:
+                    return key
+        return None
+
+    def is_up(self, key: str) -> bool:
+        return self._down_until.get(key, 0.0) <= time.monotonic()
+
+    def mark_down(self, key: str) -> None:
+        if self.is_up(key):
+            logger.warning(
+                "Replica %s failed, reading from the primary for %ss",
+                key,
+                self.retry_after,
+            )
+        self._down_until[key] = time.monotonic() + self.retry_after
+
+
+@contextmanager
+def primary():
+    """
+    Read from the primary within the block, e.g. the rows a write is about
+    to be based on.
+    """
+    replica = g.pop("db_replica", None)
+    try:
+        yield
+    finally:
+        g.db_replica = replica
+
+
+def init_replicas(app) -> None:
+    """
+    Route the reads of GET and HEAD requests to the replicas listed in
+    DATABASE_REPLICA_URLS, except for REPLICA_STICKY_SECONDS after a write
+    request of the same session so that users see their own changes. A
+    replica whose connection fails is left alone for REPLICA_RETRY_SECONDS
+    and the request is run again on the primary.
+    """
+    configs = app.config["DATABASE_REPLICAS"]
+    if not configs:
+        return
+    # Like the primary's, the engines only connect on first use.
+    engines = {
+        key: create_engine(config["url"], **config["options"])
+        for key, config in configs.items()
+    }
+    replicas = ReplicaSet(engines, app.config["REPLICA_RETRY_SECONDS"])
+    app.extensions["replicas"] = replicas
+
+    for key, engine in engines.items():
+        instrument_engine(app, engine)
+        watch_engine(engine)
+
+        @event.listens_for(engine, "handle_error")
+        def _replica_error(context, key=key):
+            # Lost or refused connections only (there is no connection yet
+            # when connecting fails): a statement or lock timeout says
+            # nothing about the replica's health.
+            if context.is_disconnect or context.connection is None:
+                replicas.mark_down(key)
+
+    @app.before_request
+    def route_reads():
+        g.db_replica = None
+        if request.method not in READ_METHODS:
+            return
+        if session.get("primary_until", 0) > time.time():
+            return
+        g.db_replica = replicas.pick()
+
+    @app.after_request
+    def stick_to_primary(response):
+        # Only after writes a user will want to see. Anonymous, failed and
+        # refused requests must not start a session (or save one, for the
+        # server-side backends) just to carry this.
+        if (
+            request.method not in READ_METHODS
+            and response.status_code < 400
+            and session.get("user_id") is not None
+        ):
+            sticky = app.config["REPLICA_STICKY_SECONDS"]
+            session["primary_until"] = time.time() + sticky
+        return response
+
+    @app.errorhandler(OperationalError)
+    @app.errorhandler(InterfaceError)
+    def replica_failed(exc):
+        replica = g.get("db_replica")
+        if replica is None or replicas.is_up(replica):
+            raise exc
+        # Only reads ran on the replica: running the view again is safe.
+        db.session.remove()
+        g.db_replica = None
+        view = app.view_functions[request.endpoint]
+        return app.ensure_sync(view)(**request.view_args)
@@ -0,0 +1,90 @@
+# search.py
+from extensions import db
+from models import Task, search_document
+from pagination import InvalidCursor, Page
+from sqlalchemy import case, func, or_, text
+
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+# Deeper pages would rank and skip that many matches on every request.
+MAX_OFFSET = 10_000
+
+
+def normalize_query(q: str | None) -> str:
+    """
+    The search string with whitespace collapsed; empty means "no search".
+    """
+    return " ".join((q or "").split())[:MAX_QUERY_LENGTH]
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _postgres_search(query, q: str):
+    tsquery = func.websearch_to_tsquery(text("'english'::regconfig"), q)
+    document = search_document(Task.title, Task.description)
+    # The @@ predicate is the ix_tasks_search GIN index expression.
+    query = query.filter(document.op("@@")(tsquery))
+    return query, func.ts_rank_cd(document, tsquery)
+
+
+def _like_search(query, q: str):
+    # Fallback for SQLite: every term must appear in the title or the
+    # description (LIKE is case-insensitive for ASCII there). A term found in
+    # the title weighs more than one only found in the description.
+    rank = 0
+    for term in q.split()[:MAX_TERMS]:
+        pattern = _like_pattern(term)
+        in_title = Task.title.like(pattern, escape="\\")
+        in_description = Task.description.like(pattern, escape="\\")
+        query = query.filter(or_(in_title, in_description))
+        rank = rank + case((in_title, 2), (in_description, 1), else_=0)
+    return query, rank
+
+
+def decode_offset(cursor: str) -> int:
+    """
+    The offset of a search cursor. Raises InvalidCursor unless it is plain
+    ASCII digits (isdigit() alone lets "²" through, int() alone " 1_0")
+    up to MAX_OFFSET.
+    """
+    try:
+        if not (cursor.isascii() and cursor.isdigit()):
+            raise ValueError(cursor)
+        offset = int(cursor)
+    except ValueError as exc:
+        raise InvalidCursor(cursor) from exc
+    if offset > MAX_OFFSET:
+        raise InvalidCursor(cursor)
+    return offset
+
+
+def search_tasks(query, q: str, cursor: str | None, per_page: int) -> Page:
+    """
+    One page of the tasks of `query` matching `q`, best match first.
+
+    Ranked results are paged by offset: the rank of every match has to be
+    computed to order them anyway, so a keyset wouldn't save that work. The
+    cursor is the offset of the first row of the page, up to MAX_OFFSET.
+    """
+    offset = decode_offset(cursor) if cursor else 0
+
+    if db.engine.dialect.name == "postgresql":
+        query, rank = _postgres_search(query, q)
+    else:
+        query, rank = _like_search(query, q)
+
+    rows = (
+        query.order_by(rank.desc(), Task.id.asc())
+        .offset(offset)
+        .limit(per_page + 1)
+        .all()
+    )
+    page = Page(items=rows[:per_page])
+    if len(rows) > per_page and offset + per_page <= MAX_OFFSET:
+        page.next_cursor = str(offset + per_page)
+    if offset:
+        page.prev_cursor = str(max(offset - per_page, 0))
+    return page
@@ -0,0 +1,256 @@
+# sessions.py
+import re
+import secrets
+import time
+from datetime import timedelta
+
+from cache import TTLCache, make_cache
+from extensions import db
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from models import SessionRecord, _utcnow
+from sqlalchemy import delete, insert, select, update
+
+BACKENDS = ("cookie", "memory", "cache", "sql")
+
+# 32 URL-safe characters (192 random bits) instead of a signed cookie carrying
+# the whole session.
+_SID_RE = re.compile(r"[A-Za-z0-9_-]{32}")
+
+
+def _new_sid() -> str:
+    return secrets.token_urlsafe(24)
+
+
+class ServerSession(SessionMixin):
+    """
+    Session data kept server-side. Nothing is read from the store until the
+    first access, and save_session() writes it back only when modified.
+    """
+
+    def __init__(self, store, sid: str | None):
+        self.store = store
+        self.sid = sid
+        self.had_cookie = sid is not None
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.stored_at = None
+        self.rotated_from = None
+        self._data = None if sid else {}
+
+    @property
+    def data(self) -> dict:
+        self.accessed = True
+        if self._data is None:
+            raw = self.store.load(self.sid)
+            if raw is None:
+                # Unknown, expired or revoked: start over with a fresh id.
+                self.sid, self.new, self._data = None, True, {}
+            else:
+                record = session_json_serializer.loads(raw)
+                self._data, self.stored_at = record["d"], record["t"]
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self) -> None:
+        # login and logout clear the session: the next write gets a new id, so
+        # an id known before login (session fixation) is worthless after it.
+        self.accessed = self.modified = True
+        if self.sid is not None:
+            self.rotated_from = self.sid
+        self.sid, self._data = None, {}
+
+
+class CacheSessionStore:
+    """
+    Sessions in a TTLCache (this process only) or RedisCache (shared).
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def load(self, sid: str) -> str | None:
+        return self.cache.get(f"s:{sid}")
+
+    def save(self, sid: str, raw: str, user_id, ttl: timedelta) -> None:
+        seconds = ttl.total_seconds()
+        self.cache.set(f"s:{sid}", raw, ttl=seconds)
+        if user_id is not None:
+            # Best-effort index for revoke_user(); the newest ids are kept.
+            sids = self.cache.get(f"u:{user_id}") or []
+            if sid not in sids:
+                self.cache.set(f"u:{user_id}", (sids + [sid])[-50:], ttl=seconds)
+
+    def delete(self, sid: str) -> None:
+        self.cache.delete(f"s:{sid}")
+
+    def revoke_user(self, user_id: int) -> int:
+        sids = self.cache.get(f"u:{user_id}") or []
+        for sid in sids:
+            self.delete(sid)
+        self.cache.delete(f"u:{user_id}")
+        return len(sids)
+
+    def gc(self, batch_size: int = 1000) -> int:
+        # Entries expire by themselves.
+        return 0
+
+
+class SQLSessionStore:
+    """
+    Sessions in the sessions table, on connections of their own so that
+    saving never commits (or trips over) the request's db.session.
+    """
+
+    def load(self, sid: str) -> str | None:
+        with db.engine.connect() as conn:
+            return conn.scalar(
+                select(SessionRecord.data).where(
+                    SessionRecord.id == sid, SessionRecord.expires_at > _utcnow()
+                )
+            )
+
+    def save(self, sid: str, raw: str, user_id, ttl: timedelta) -> None:
+        values = {"data": raw, "user_id": user_id, "expires_at": _utcnow() + ttl}
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                update(SessionRecord).where(SessionRecord.id == sid).values(**values)
+            )
+            if updated.rowcount == 0:
+                conn.execute(insert(SessionRecord).values(id=sid, **values))
+
+    def delete(self, sid: str) -> None:
+        with db.engine.begin() as conn:
+            conn.execute(delete(SessionRecord).where(SessionRecord.id == sid))
+
+    def revoke_user(self, user_id: int) -> int:
+        with db.engine.begin() as conn:
+            return conn.execute(
+                delete(SessionRecord).where(SessionRecord.user_id == user_id)
+            ).rowcount
+
+    def gc(self, batch_size: int = 1000) -> int:
+        """
+        Delete expired sessions, `batch_size` rows per transaction.
+        """
+        removed = 0
+        while True:
+            expired = (
+                select(SessionRecord.id)
+                .where(SessionRecord.expires_at <= _utcnow())
+                .limit(batch_size)
+            )
+            with db.engine.begin() as conn:
+                count = conn.execute(
+                    delete(SessionRecord).where(SessionRecord.id.in_(expired))
+                ).rowcount
+            removed += count
+            if count < batch_size:
+                return removed
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid is not None and not _SID_RE.fullmatch(sid):
+            sid = None
+        return ServerSession(self.store, sid)
+
+    def _stale(self, app, session: ServerSession) -> bool:
+        # Unmodified sessions are rewritten once half their lifetime has gone,
+        # so active users don't expire without a write per request.
+        if session.stored_at is None:
+            return False
+        age = time.time() - session.stored_at
+        return age > app.permanent_session_lifetime.total_seconds() / 2
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        if session.rotated_from is not None:
+            self.store.delete(session.rotated_from)
+
+        if not session.modified and not self._stale(app, session):
+            return
+
+        if not session.data:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            if session.had_cookie:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        issue_cookie = session.sid is None or session.permanent
+        if session.sid is None:
+            session.sid = _new_sid()
+        record = {"d": dict(session.data), "t": time.time()}
+        raw = session_json_serializer.dumps(record)
+        self.store.save(
+            session.sid,
+            raw,
+            session.data.get("user_id"),
+            app.permanent_session_lifetime,
+        )
+        if issue_cookie:
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+def init_sessions(app) -> None:
+    """
+    Keep sessions server-side unless SESSION_BACKEND is "cookie" (Flask's
+    signed cookie, the default).
+    """
+    backend = app.config["SESSION_BACKEND"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend!r}")
+    if backend == "cookie":
+        return
+
+    ttl = app.permanent_session_lifetime.total_seconds()
+    if backend == "memory":
+        store = CacheSessionStore(TTLCache(app.config["SESSION_CACHE_SIZE"], ttl))
+    elif backend == "cache":
+        store = CacheSessionStore(
+            make_cache(app, "session", app.config["SESSION_CACHE_SIZE"], ttl)
+        )
+    else:
+        store = SQLSessionStore()
+    app.extensions["session_store"] = store
+    app.session_interface = ServerSessionInterface(store)
+
+
+def session_store(app):
+    """
+    The server-side store, or None with cookie sessions.
+    """
+    return app.extensions.get("session_store")
@@ -0,0 +1,126 @@
+// Keeps the task list of index.html current from the /events stream (see
+// events.py), and sends complete/delete/undo without reloading the page.
+(function () {
+  "use strict";
+
+  var root = document.getElementById("task-list");
+  if (!root || !root.dataset.events || !window.EventSource) {
+    return;
+  }
+  var undo = document.querySelector("form.undo");
+
+  // The server orders by due date (no date last), then id.
+  function sortKey(item) {
+    return [item.dataset.due || "\uffff", Number(item.dataset.taskId)];
+  }
+
+  function before(a, b) {
+    return a[0] < b[0] || (a[0] === b[0] && a[1] < b[1]);
+  }
+
+  function belongsHere(event) {
+    var status = root.dataset.status;
+    if (status === "overdue") {
+      return event.is_overdue;
+    }
+    return status === "all" || (status === "done") === event.is_completed;
+  }
+
+  function updateCounts(summary) {
+    document.querySelectorAll("[data-count]").forEach(function (count) {
+      var value = summary[count.dataset.count];
+      if (count.dataset.count === "overdue") {
+        count.textContent = value + " overdue";
+        count.hidden = !value;
+      } else {
+        count.textContent = count.dataset.label + " (" + value + ")";
+      }
+    });
+  }
+
+  function upsert(list, event) {
+    var template = document.createElement("template");
+    template.innerHTML = event.html.trim();
+    var item = template.content.firstElementChild;
+    var key = sortKey(item);
+    var items = list.querySelectorAll(".task-item");
+    var index = 0;
+    while (index < items.length && before(sortKey(items[index]), key)) {
+      index++;
+    }
+    // Outside of this page: it belongs to the previous or the next one.
+    if ((index === 0 && list.dataset.prev === "1") ||
+        (index === items.length && list.dataset.more === "1")) {
+      return;
+    }
+    list.insertBefore(item, items[index] || null);
+  }
+
+  function apply(event) {
+    if (event.action === "reset") {
+      window.location.reload();
+      return;
+    }
+    var list = root.querySelector(".task-list");
+    var current = root.querySelector('[data-task-id="' + event.id + '"]');
+    var inSearch = root.dataset.search === "1";
+    if (event.action === "upsert" && !current && !list && !inSearch &&
+        belongsHere(event)) {
+      // The first task of an empty list: the server renders the page.
+      window.location.reload();
+      return;
+    }
+    if (current) {
+      current.remove();
+    }
+    // Search results are only updated in place, never added to.
+    if (event.action === "upsert" && list && belongsHere(event) &&
+        (current || !inSearch)) {
+      upsert(list, event);
+    }
+    updateCounts(event.summary);
+    root.dataset.version = event.version;
+  }
+
+  var source = new EventSource(root.dataset.events);
+  source.addEventListener("hello", function (message) {
+    // Something changed between rendering the page and (re)connecting.
+    if (JSON.parse(message.data).version !== root.dataset.version) {
+      source.close();
+      window.location.reload();
+    }
+  });
+  source.addEventListener("task", function (message) {
+    apply(JSON.parse(message.data));
+  });
+
+  document.addEventListener("submit", function (submit) {
+    var form = submit.target;
+    // defaultPrevented: a confirm() in onsubmit was cancelled.
+    if (!form.hasAttribute("data-live") || submit.defaultPrevented) {
+      return;
+    }
+    submit.preventDefault();
+    fetch(form.action, {
+      method: "POST",
+      body: new FormData(form),
+      headers: { "X-Requested-With": "fetch" },
+      credentials: "same-origin"
+    }).then(function (response) {
+      if (response.status !== 204) {
+        // Whatever went wrong, the regular page shows it.
+        window.location.reload();
+        return;
+      }
+      // The list itself is updated by the event of the change.
+      if (form === undo) {
+        undo.hidden = true;
+      } else if (undo && form.dataset.restore) {
+        undo.action = form.dataset.restore;
+        undo.hidden = false;
+      }
+    }, function () {
+      form.submit();
+    });
+  });
+})();
@@ -49,3 +49,14 @@ def client(flask_app):
     with flask_app.test_client() as c:
         yield c
 
+
+
+### Function : query_budget
+@pytest.fixture()
+def query_budget(flask_app):
+    """
+    Function to fail requests over their query budget or repeating a SELECT
+    (N+1) instead of only logging it; returns the per-endpoint budgets.
+    """
+    flask_app.config["QUERY_BUDGET_MODE"] = "raise"
+    return flask_app.config["QUERY_BUDGETS"]
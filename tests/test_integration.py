@@ -1,9 +1,24 @@
 # test_integration.py
 ### Modules importation
-from datetime import date, timedelta
+import asyncio
+import io
+import json
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
 
+import pytest
+from app import create_app
 from extensions import db
-from models import Task, User
+from flask import g
+from flask_migrate import upgrade
+from models import Job, RateLimitBucket, SessionRecord, Task, TaskCounter, User
+from query_budget import QueryBudgetExceeded
+from ratelimit import init_rate_limits
+from sessions import init_sessions
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.exc import OperationalError
 
 
 ### ------------------------------ Helpers ------------------------------ ###
@@ -127,3 +142,1174 @@ def test_toggle_task_completion(client):
     with client.application.app_context():
         t = Task.query.get(task_id)
         assert t.is_completed is True
+
+### Fourth test : paginating the task list
+### Function : test_index_keyset_pagination
+def test_index_keyset_pagination(client):
+    """
+    Test that the task list is split in pages walked through opaque cursors.
+    """
+    ### Registration and login
+    register(client, "test5", "password5")
+    login(client, "test5", "password5")
+
+    ### Five tasks, the last one without a due date so it sorts at the end
+    with client.application.app_context():
+        u = User.query.filter_by(username="test5").one()
+        for i in range(5):
+            due = date.today() + timedelta(days=i) if i < 4 else None
+            db.session.add(Task(title=f"Paged {i}", due_date=due, user_id=u.id))
+        db.session.commit()
+
+    ### First page holds the two earliest tasks and a link to the next one
+    resp = client.get("/?per_page=2")
+    assert b"Paged 0" in resp.data and b"Paged 1" in resp.data
+    assert b"Paged 2" not in resp.data
+    next_cursor = re.search(rb"cursor=([\w-]+)\">Next", resp.data).group(1)
+
+    ### Second page, reached through the cursor
+    resp = client.get(f"/?per_page=2&cursor={next_cursor.decode()}")
+    assert b"Paged 2" in resp.data and b"Paged 3" in resp.data
+    assert b"Paged 1" not in resp.data
+    next_cursor = re.search(rb"cursor=([\w-]+)\">Next", resp.data).group(1)
+
+    ### Last page with the undated task, then back to the previous one
+    resp = client.get(f"/?per_page=2&cursor={next_cursor.decode()}")
+    assert b"Paged 4" in resp.data
+    assert b"Next" not in resp.data
+    prev_cursor = re.search(rb"cursor=([\w-]+)\">&laquo; Previous", resp.data).group(1)
+
+    resp = client.get(f"/?per_page=2&cursor={prev_cursor.decode()}")
+    assert b"Paged 2" in resp.data and b"Paged 3" in resp.data
+
+    ### A forged cursor is rejected
+    assert client.get("/?cursor=garbage").status_code == 400
+
+### Fifth test : versioned migrations
+### Function : test_migrations_create_task_indexes
+def test_migrations_create_task_indexes(monkeypatch, tmp_path):
+    """
+    Test that upgrading an empty database creates the composite task indexes.
+    """
+    ### A scratch SQLite database so the migrations start from nothing
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'migrations.db'}")
+    app = create_app()
+
+    with app.app_context():
+        db.drop_all()
+        upgrade()
+        names = {idx["name"] for idx in inspect(db.engine).get_indexes("tasks")}
+        db.engine.dispose()
+
+    assert {
+        "ix_tasks_user_due",
+        "ix_tasks_user_completed_due",
+        "ix_tasks_user_open_due",
+    } <= names
+
+### Sixth test : cached user lookup
+### Function : test_logged_in_user_is_cached
+def test_logged_in_user_is_cached(client):
+    """
+    Test that the users table is not queried again once the user is cached,
+    and that renaming the user refreshes the cached identity.
+    """
+    ### Registration and login
+    register(client, "test6", "password6")
+    login(client, "test6", "password6")
+
+    ### Record every statement that reads the users table
+    user_queries = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement:
+            user_queries.append(statement)
+
+    with client.application.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        ### The first page view fills the cache, the next ones hit it
+        client.get("/")
+        first = len(user_queries)
+        client.get("/")
+        client.get("/")
+        assert len(user_queries) == first
+
+        ### Renaming the user invalidates the cached identity
+        with client.application.app_context():
+            u = User.query.filter_by(username="test6").one()
+            u.username = "test6-renamed"
+            db.session.commit()
+        assert b"test6-renamed" in client.get("/").data
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+### Seventh test : toggling and deleting someone else's task
+### Function : test_toggle_delete_other_users_task_is_404
+def test_toggle_delete_other_users_task_is_404(client):
+    """
+    Test that toggle and delete only match the logged-in user's own tasks.
+    """
+    ### Two users, the task belongs to the first one
+    register(client, "owner", "password7")
+    register(client, "intruder", "password8")
+    with client.application.app_context():
+        owner = User.query.filter_by(username="owner").one()
+        task = Task(title="Not yours", user_id=owner.id)
+        db.session.add(task)
+        db.session.commit()
+        task_id = task.id
+
+    ### The second user can neither toggle nor delete it
+    login(client, "intruder", "password8")
+    assert client.post(f"/tasks/{task_id}/toggle").status_code == 404
+    assert client.post(f"/tasks/{task_id}/delete").status_code == 404
+
+    ### Back as the owner, toggling twice reopens it and delete removes it
+    login(client, "owner", "password7")
+    client.post(f"/tasks/{task_id}/toggle")
+    client.post(f"/tasks/{task_id}/toggle")
+    with client.application.app_context():
+        assert db.session.get(Task, task_id).is_completed is False
+
+    assert client.post(f"/tasks/{task_id}/delete").status_code == 302
+    with client.application.app_context():
+        assert db.session.get(Task, task_id).deleted_at is not None
+
+### Eighth test : JSON API
+### Function : test_api_task_crud
+def test_api_task_crud(client):
+    """
+    Test create, read, update and delete through the JSON API.
+    """
+    ### The API refuses anonymous calls
+    assert client.get("/api/v1/tasks").status_code == 401
+
+    register(client, "test9", "password9")
+    login(client, "test9", "password9")
+
+    ### Creating with the same validation rules as the HTML form
+    resp = client.post("/api/v1/tasks", json={"title": ""})
+    assert resp.status_code == 400
+    assert resp.get_json()["error"] == "Title is required."
+
+    resp = client.post(
+        "/api/v1/tasks", json={"title": "From API", "due_date": "2030-01-02"}
+    )
+    assert resp.status_code == 201
+    task_id = resp.get_json()["id"]
+
+    ### Reading and partially updating it
+    assert client.get(f"/api/v1/tasks/{task_id}").get_json()["title"] == "From API"
+    resp = client.patch(f"/api/v1/tasks/{task_id}", json={"is_completed": True})
+    assert resp.get_json()["is_completed"] is True
+    assert resp.get_json()["due_date"] == "2030-01-02"
+
+    ### Listing and deleting
+    tasks = client.get("/api/v1/tasks?status=done").get_json()["tasks"]
+    assert [t["id"] for t in tasks] == [task_id]
+    assert client.delete(f"/api/v1/tasks/{task_id}").status_code == 204
+    assert client.get(f"/api/v1/tasks/{task_id}").status_code == 404
+
+### Function : test_api_bulk_endpoints
+def test_api_bulk_endpoints(client):
+    """
+    Test bulk create, complete and delete, each in a single transaction.
+    """
+    register(client, "test10", "password10")
+    login(client, "test10", "password10")
+
+    ### One invalid row rejects the whole batch
+    resp = client.post(
+        "/api/v1/tasks/bulk",
+        json={"tasks": [{"title": "ok"}, {"title": "bad", "due_date": "02/01/2030"}]},
+    )
+    assert resp.status_code == 400
+    assert resp.get_json()["errors"] == [
+        {"index": 1, "error": "Invalid date format. Use YYYY-MM-DD."}
+    ]
+    with client.application.app_context():
+        assert Task.query.count() == 0
+
+    ### A valid batch is inserted at once
+    resp = client.post(
+        "/api/v1/tasks/bulk",
+        json={"tasks": [{"title": f"Bulk {i}"} for i in range(20)]},
+    )
+    assert resp.status_code == 201
+    ids = resp.get_json()["ids"]
+    assert len(ids) == 20
+
+    ### Completing and deleting subsets of them
+    resp = client.post("/api/v1/tasks/bulk-complete", json={"ids": ids[:5]})
+    assert resp.get_json()["ids"] == sorted(ids[:5])
+    resp = client.post("/api/v1/tasks/bulk-delete", json={"ids": ids[10:]})
+    assert resp.get_json()["ids"] == sorted(ids[10:])
+
+    with client.application.app_context():
+        assert Task.query.filter_by(is_completed=True).count() == 5
+        assert Task.query.filter_by(deleted_at=None).count() == 10
+
+### Ninth test : metrics endpoint
+### Function : test_metrics_expose_pool_state
+def test_metrics_expose_pool_state(client):
+    """
+    Test that /metrics reports connection pool gauges in Prometheus format.
+    """
+    ### Any page view checks a connection out of the pool
+    register(client, "test11", "password11")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    assert b"db_pool_checked_out 0" in resp.data
+    assert b"# TYPE db_pool_checkouts_total counter" in resp.data
+
+### Function : test_metrics_time_requests_and_sql
+def test_metrics_time_requests_and_sql(client, caplog):
+    """
+    Test that requests are counted and timed per endpoint with their queries,
+    and that statements over SLOW_QUERY_MS are logged.
+    """
+    register(client, "test18", "password18")
+    login(client, "test18", "password18")
+    client.application.extensions["request_metrics"].slow_query_seconds = 0
+
+    resp = client.get("/")
+    timing = resp.headers["Server-Timing"]
+    assert re.match(r'db;dur=[\d.]+;desc="[1-9]\d* queries"', timing)
+    assert "Slow query" in caplog.text
+
+    text = client.get("/metrics").data.decode()
+    ### The redirect after login was an index view too
+    assert 'http_requests_total{endpoint="index",method="GET",status="200"} 2' in text
+    assert 'duration_seconds_count{endpoint="index",method="GET"} 2' in text
+    assert re.search(r'http_request_sql_queries_sum\{endpoint="index"\} [1-9]', text)
+    assert re.search(r'db_slow_queries_total\{endpoint="index"\} [1-9]', text)
+
+### Tenth test : app construction without database I/O
+### Function : test_create_app_does_not_touch_database
+def test_create_app_does_not_touch_database(monkeypatch, tmp_path):
+    """
+    Test that building the app opens no connection, even to an unusable database.
+    """
+    ### A database path that can't be opened: any I/O would raise
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'missing' / 'x.db'}")
+
+    app = create_app()
+
+    with app.app_context():
+        assert db.engine.pool.checkedout() == 0
+        assert not (tmp_path / "missing").exists()
+
+### Eleventh test : rehashing on login
+### Function : test_login_rehashes_outdated_password_hash
+def test_login_rehashes_outdated_password_hash(client):
+    """
+    Test that a successful login upgrades a hash made with old parameters.
+    """
+    ### A user whose hash predates the configured method
+    with client.application.app_context():
+        u = User(username="legacy")
+        u.set_password("password12", method="pbkdf2:sha256:1000")
+        db.session.add(u)
+        db.session.commit()
+
+    client.application.config["PASSWORD_HASH_METHOD"] = "pbkdf2:sha256:2000"
+
+    ### A failed login leaves the hash alone
+    login(client, "legacy", "wrong")
+    with client.application.app_context():
+        old_hash = User.query.filter_by(username="legacy").one().password_hash
+        assert old_hash.startswith("pbkdf2:sha256:1000$")
+
+    ### A successful one rewrites it with the new parameters
+    login(client, "legacy", "password12")
+    with client.application.app_context():
+        u = User.query.filter_by(username="legacy").one()
+        assert u.password_hash.startswith("pbkdf2:sha256:2000$")
+        assert u.check_password("password12")
+
+### Twelfth test : task list fragment cache
+### Function : test_task_list_fragment_is_cached_until_a_change
+def test_task_list_fragment_is_cached_until_a_change(client):
+    """
+    Test that reloading the list skips the task query until a task changes.
+    """
+    register(client, "test13", "password13")
+    login(client, "test13", "password13")
+    client.post("/tasks/new", data={"title": "Cached task"})
+
+    ### Record every statement that loads task rows
+    task_queries = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "tasks.title" in statement:
+            task_queries.append(statement)
+
+    with client.application.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        ### The first view renders the list, the second one is served cached
+        assert b"Cached task" in client.get("/").data
+        rendered = len(task_queries)
+        assert b"Cached task" in client.get("/").data
+        assert len(task_queries) == rendered
+
+        ### Creating a task invalidates the cached list
+        client.post("/tasks/new", data={"title": "Second task"})
+        resp = client.get("/")
+        assert b"Second task" in resp.data
+        assert len(task_queries) > rendered
+
+        ### So does a change the cache never heard of (another worker's)
+        with client.application.app_context():
+            db.session.execute(
+                update(Task)
+                .where(Task.title == "Second task")
+                .values(title="Renamed elsewhere", updated_at=datetime(2100, 1, 1))
+            )
+            db.session.commit()
+        assert b"Renamed elsewhere" in client.get("/").data
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+### Thirteenth test : conditional GET
+### Function : test_index_answers_revalidation_with_304
+def test_index_answers_revalidation_with_304(client):
+    """
+    Test that an unchanged task list is answered with 304 Not Modified.
+    """
+    register(client, "test14", "password14")
+    login(client, "test14", "password14")
+    client.post("/tasks/new", data={"title": "Etag task"})
+
+    ### The view showing the flash messages isn't kept; the next has an ETag
+    flashed = client.get("/")
+    assert "ETag" not in flashed.headers
+    assert flashed.headers["Cache-Control"] == "no-store"
+    first = client.get("/")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert first.headers["Last-Modified"]
+
+    ### Revalidating the same list is a 304 without a body
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    ### Another filter is another ETag
+    resp = client.get("/?status=done", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+
+    ### Changing a task changes the ETag
+    with client.application.app_context():
+        task_id = Task.query.filter_by(title="Etag task").one().id
+    client.post(f"/tasks/{task_id}/toggle")
+    client.get("/")
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+    ### The edit form is revalidated the same way
+    edit = client.get(f"/tasks/{task_id}/edit")
+    resp = client.get(
+        f"/tasks/{task_id}/edit", headers={"If-None-Match": edit.headers["ETag"]}
+    )
+    assert resp.status_code == 304
+
+    ### Nor is the page offering to undo a delete, replayed by a later 304
+    client.post(f"/tasks/{task_id}/delete")
+    undo = client.get("/")
+    assert b"Task deleted" in undo.data
+    assert "ETag" not in undo.headers
+    after = client.get("/")
+    assert b"Task deleted" not in after.data
+    resp = client.get("/", headers={"If-None-Match": after.headers["ETag"]})
+    assert resp.status_code == 304
+
+### Fourteenth test : materialized task counters
+### Function : test_task_counters_follow_mutations_and_reconcile
+def test_task_counters_follow_mutations_and_reconcile(client):
+    """
+    Test that the summary follows task changes and that reconcile fixes drift.
+    """
+    register(client, "test15", "password15")
+    login(client, "test15", "password15")
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+
+    ### Creating, completing and deleting tasks moves the counters
+    client.post("/api/v1/tasks/bulk", json={"tasks": [
+        {"title": "Late", "due_date": yesterday},
+        {"title": "Open"},
+        {"title": "Done"},
+    ]})
+    with client.application.app_context():
+        ids = {t.title: t.id for t in Task.query.filter(Task.title.in_(
+            ["Late", "Open", "Done"]
+        ))}
+    client.post(f"/tasks/{ids['Done']}/toggle")
+    assert client.get("/api/v1/summary").get_json() == {
+        "open": 2, "done": 1, "overdue": 1, "total": 3,
+    }
+
+    client.delete(f"/api/v1/tasks/{ids['Late']}")
+    assert client.get("/api/v1/summary").get_json() == {
+        "open": 1, "done": 1, "overdue": 0, "total": 2,
+    }
+    assert b"Open (1)" in client.get("/").data
+
+    ### Drift from writes made behind the app's back is repaired by reconcile
+    with client.application.app_context():
+        user_id = User.query.filter_by(username="test15").one().id
+        db.session.add(Task(title="Sneaky", user_id=user_id))
+        db.session.commit()
+    assert client.get("/api/v1/summary").get_json()["open"] == 1
+
+    result = client.application.test_cli_runner().invoke(
+        args=["counters", "reconcile", "--batch-size", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    assert client.get("/api/v1/summary").get_json()["open"] == 2
+
+### Function : test_first_counter_write_survives_a_concurrent_insert
+def test_first_counter_write_survives_a_concurrent_insert(flask_app, monkeypatch):
+    """
+    Test that when another request inserts a user's first counters between
+    the UPDATE and the INSERT of apply_task_changes(), the change is applied
+    to those instead of failing on the primary key.
+    """
+    import counters
+
+    insert_counters = counters._insert_counters
+
+    def racing_insert(today, *criteria):
+        # The other request wins, with counts from before this change.
+        db.session.add(TaskCounter(user_id=user.id, open_count=0, done_count=0))
+        db.session.flush()
+        return insert_counters(today, *criteria)
+
+    with flask_app.app_context():
+        user = User(username="test33", password_hash="x")
+        db.session.add(user)
+        db.session.flush()
+        monkeypatch.setattr(counters, "_insert_counters", racing_insert)
+        counters.apply_task_changes(user.id, [(None, (False, None))])
+        db.session.commit()
+        counter = db.session.get(TaskCounter, user.id)
+        assert (counter.open_count, counter.done_count) == (1, 0)
+
+### Fifteenth test : task search
+### Function : test_search_ranks_and_paginates_matches
+def test_search_ranks_and_paginates_matches(client):
+    """
+    Test that a search returns the matching tasks only, title matches first.
+    """
+    register(client, "test16", "password16")
+    login(client, "test16", "password16")
+    client.post("/api/v1/tasks/bulk", json={"tasks": [
+        {"title": "Call the plumber", "description": "about the invoice"},
+        {"title": "Pay invoice", "description": "plumber's invoice"},
+        {"title": "Water the plants"},
+        {"title": "Invoice 50% off"},
+    ]})
+
+    ### Title matches rank above description-only matches
+    html = client.get("/?q=invoice").data.decode()
+    assert "Water the plants" not in html
+    assert html.index("Pay invoice") < html.index("Call the plumber")
+
+    ### Every term has to match, and wildcards are taken literally
+    assert b"Call the plumber" not in client.get("/?q=invoice+pay").data
+    assert b"Invoice 50% off" in client.get("/?q=50%25").data
+    assert b"No tasks match" in client.get("/?q=5_%25").data
+
+    ### Results are paginated and keep the search in the pager links
+    resp = client.get("/?q=invoice&per_page=1")
+    assert b"Pay invoice" in resp.data
+    next_link = re.search(r'href="([^"]*cursor=[^"]*)"', resp.data.decode())
+    assert "q=invoice" in next_link.group(1)
+    resp = client.get(next_link.group(1).replace("&amp;", "&"))
+    assert b"Pay invoice" not in resp.data
+    assert client.get("/?q=invoice&cursor=abc").status_code == 400
+    assert client.get("/?q=invoice&cursor=%C2%B2").status_code == 400
+    assert client.get("/?q=invoice&cursor=" + "9" * 23).status_code == 400
+
+### Sixteenth test : task import and export
+### Function : test_import_reports_bad_rows_and_export_streams_back
+def test_import_reports_bad_rows_and_export_streams_back(client):
+    """
+    Test that an import keeps the valid rows, reports the others by line, and
+    that the export returns them in CSV and JSONL.
+    """
+    register(client, "test17", "password17")
+    login(client, "test17", "password17")
+    client.application.config["IMPORT_BATCH_SIZE"] = 2
+
+    ### Multipart CSV upload: line 3 and 5 are rejected with create_task messages
+    csv_file = (
+        "title,description,due_date,is_completed\n"
+        "Imported one,,2030-01-31,false\n"
+        ",no title,,\n"
+        "Imported two,desc,,true\n"
+        "Imported three,,31/01/2030,\n"
+        "Imported four,,,\n"
+    ).encode()
+    resp = client.post(
+        "/api/v1/tasks/import",
+        data={"file": (io.BytesIO(csv_file), "tasks.csv")},
+        content_type="multipart/form-data",
+    )
+    body = resp.get_json()
+    assert body["imported"] == 3
+    assert body["errors"] == [
+        {"line": 3, "error": "Title is required."},
+        {"line": 5, "error": "Invalid date format. Use YYYY-MM-DD."},
+    ]
+
+    ### Raw JSONL body
+    resp = client.post(
+        "/api/v1/tasks/import",
+        data=b'{"title": "From JSONL"}\nnot json\n',
+        content_type="application/x-ndjson",
+    )
+    assert resp.get_json()["imported"] == 1
+    assert resp.get_json()["errors"] == [{"line": 2, "error": "Invalid JSON."}]
+    assert client.get("/api/v1/summary").get_json()["total"] == 4
+    assert client.post(
+        "/api/v1/tasks/import", data=b"x", content_type="application/pdf"
+    ).status_code == 400
+
+    ### The export streams every task back
+    resp = client.get("/api/v1/tasks/export?format=jsonl")
+    rows = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert [row["title"] for row in rows] == [
+        "Imported one", "Imported two", "Imported four", "From JSONL",
+    ]
+    assert rows[1]["is_completed"] is True
+    resp = client.get("/api/v1/tasks/export?format=csv&status=done")
+    assert resp.mimetype == "text/csv"
+    assert resp.data.decode().splitlines()[1].startswith(f"{rows[1]['id']},")
+
+    ### The CLI exports the same data
+    result = client.application.test_cli_runner().invoke(
+        args=["tasks", "export", "test17", "--format", "jsonl"]
+    )
+    assert result.exit_code == 0, result.output
+    assert len(result.output.splitlines()) == 4
+
+### Seventeenth test : query budgets
+### Function : test_task_pages_stay_within_their_query_budget
+def test_task_pages_stay_within_their_query_budget(client, query_budget):
+    """
+    Test that the task pages don't grow a query per task as the list grows.
+    """
+    ### Two of them left for SESSION_BACKEND=sql (load + save)
+    query_budget.update({"index": 10, "edit_task": 5, "toggle_task": 5})
+    register(client, "test19", "password19")
+    login(client, "test19", "password19")
+    client.post("/api/v1/tasks/bulk", json={
+        "tasks": [{"title": f"Budget task {n}"} for n in range(40)]
+    })
+    with client.application.app_context():
+        task_id = Task.query.filter_by(title="Budget task 0").one().id
+
+    ### Raises QueryBudgetExceeded on any N+1
+    assert client.get("/?per_page=40").status_code == 200
+    assert client.get("/?status=open&q=budget").status_code == 200
+    assert client.get(f"/tasks/{task_id}/edit").status_code == 200
+    assert client.post(f"/tasks/{task_id}/toggle").status_code == 302
+
+### Function : test_n_plus_one_fails_in_tests_and_warns_in_production
+def test_n_plus_one_fails_in_tests_and_warns_in_production(
+    flask_app, client, query_budget, caplog
+):
+    """
+    Test that one SELECT per row trips the detector.
+    """
+    def titles_one_by_one():
+        ids = db.session.scalars(select(Task.id).where(Task.user_id == g.user_id))
+        return "|".join(
+            db.session.scalar(select(Task.title).where(Task.id == task_id))
+            for task_id in ids.all()
+        )
+
+    flask_app.add_url_rule("/n-plus-one", "n_plus_one", titles_one_by_one)
+    register(client, "test20", "password20")
+    login(client, "test20", "password20")
+    client.post("/api/v1/tasks/bulk", json={
+        "tasks": [{"title": f"Row {n}"} for n in range(10)]
+    })
+
+    ### The test fixture makes it fail the request
+    with pytest.raises(QueryBudgetExceeded, match="N\\+1"):
+        client.get("/n-plus-one")
+
+    ### In production it is served, with one warning
+    flask_app.config["QUERY_BUDGET_MODE"] = "warn"
+    assert client.get("/n-plus-one").status_code == 200
+    assert caplog.text.count("Query budget exceeded") == 1
+
+### Eighteenth test : server-side sessions
+### Function : test_server_side_sessions
+@pytest.mark.parametrize("backend", ["memory", "sql"])
+def test_server_side_sessions(flask_app, client, backend):
+    """
+    Test that the session cookie only carries an id, is only rewritten when
+    the session changes, and that sessions can be revoked and collected.
+    """
+    flask_app.config["SESSION_BACKEND"] = backend
+    init_sessions(flask_app)
+    register(client, "test21", "password21")
+
+    ### A failed login stores a flash message under a first id
+    login(client, "test21", "wrong")
+    anonymous_sid = client.get_cookie("session")
+    login(client, "test21", "password21")
+    sid = client.get_cookie("session").value
+    assert len(sid) == 32
+    assert sid != (anonymous_sid.value if anonymous_sid else None)
+
+    ### Reading the session doesn't write it back
+    resp = client.get("/")
+    assert resp.status_code == 200
+    assert "Set-Cookie" not in resp.headers
+
+    ### Revoking the user's sessions logs them out at once
+    result = flask_app.test_cli_runner().invoke(args=["sessions", "revoke", "test21"])
+    assert result.exit_code == 0, result.output
+    assert client.get("/").status_code == 302
+
+    if backend == "sql":
+        ### Expired rows are collected in bulk
+        with flask_app.app_context():
+            db.session.add_all(
+                SessionRecord(
+                    id=f"{n:032d}", data="{}", expires_at=datetime(2000, 1, 1)
+                )
+                for n in range(5)
+            )
+            db.session.commit()
+        result = flask_app.test_cli_runner().invoke(
+            args=["sessions", "gc", "--batch-size", "2"]
+        )
+        assert "Deleted 5 expired sessions." in result.output
+
+### Nineteenth test : soft delete, undo and purge
+### Function : test_soft_delete_undo_and_purge
+def test_soft_delete_undo_and_purge(flask_app, client):
+    """
+    Test that deleted tasks disappear from lists and counters, can be
+    restored until purged, and that deleting a user removes their tasks.
+    """
+    register(client, "test22", "password22")
+    login(client, "test22", "password22")
+    ids = client.post(
+        "/api/v1/tasks/bulk",
+        json={"tasks": [{"title": f"Trash {i}"} for i in range(5)]},
+    ).get_json()["ids"]
+
+    ### Deleting offers an undo and hides the task everywhere
+    client.post(f"/tasks/{ids[0]}/delete")
+    html = client.get("/").get_data(as_text=True)
+    assert f"/tasks/{ids[0]}/restore" in html
+    assert "Trash 0" not in html
+    assert "All (4)" in html
+    assert f"/tasks/{ids[0]}/restore" not in client.get("/").get_data(as_text=True)
+    assert client.get(f"/api/v1/tasks/{ids[0]}").status_code == 404
+    assert client.post(f"/tasks/{ids[0]}/toggle").status_code == 404
+    assert client.get(f"/tasks/{ids[0]}/edit").status_code == 404
+
+    ### Undo brings it back with its counters
+    assert client.post(f"/tasks/{ids[0]}/restore").status_code == 302
+    assert client.post(f"/tasks/{ids[0]}/restore").status_code == 404
+    assert client.get("/api/v1/summary").get_json()["total"] == 5
+
+    ### The purge only removes tasks deleted longer ago than the window
+    client.post("/api/v1/tasks/bulk-delete", json={"ids": ids[:3]})
+    runner = flask_app.test_cli_runner()
+    result = runner.invoke(args=["tasks", "purge", "--older-than", "3600"])
+    assert "Purged 0 deleted tasks." in result.output
+    result = runner.invoke(
+        args=["tasks", "purge", "--older-than", "0", "--batch-size", "2"]
+    )
+    assert "Purged 3 deleted tasks." in result.output
+    assert client.post(f"/api/v1/tasks/{ids[0]}/restore").status_code == 404
+    assert client.get("/api/v1/summary").get_json()["total"] == 2
+
+    ### Deleting the user removes everything they own
+    result = runner.invoke(args=["users", "delete", "test22", "--yes"])
+    assert result.exit_code == 0, result.output
+    with flask_app.app_context():
+        assert User.query.filter_by(username="test22").count() == 0
+        assert Task.query.count() == 0
+        assert TaskCounter.query.count() == 0
+
+### Twentieth test : async views
+### Function : asgi_request
+def asgi_request(
+    asgi, method, path, cookie=None, headers=(), body=b"", disconnect_after=60.0
+):
+    """
+    Function to send one request to an ASGI app; returns (status, headers, body).
+    The client disconnects `disconnect_after` seconds after sending the request.
+    """
+    path, _, query = path.partition("?")
+    raw_headers = [(b"host", b"localhost"), *headers]
+    if cookie:
+        raw_headers.append((b"cookie", f"session={cookie}".encode()))
+    if body:
+        raw_headers.append((b"content-type", b"application/json"))
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": raw_headers,
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 0),
+    }
+    messages, received = [], []
+
+    async def receive():
+        if received:
+            await asyncio.sleep(disconnect_after)
+            return {"type": "http.disconnect"}
+        received.append(True)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi(scope, receive, send))
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return messages[0]["status"], dict(messages[0]["headers"]), body
+
+
+### Function : test_async_views
+def test_async_views(flask_app, client):
+    """
+    Test that the ASGI app serves the read endpoints with the async engine,
+    with the same answers as the sync views, and passes the rest to Flask.
+    """
+    pytest.importorskip("asgiref")
+    pytest.importorskip("aiosqlite")
+    from async_db import init_async_db
+    from async_views import AsyncApp
+    from events import init_events
+
+    flask_app.config.update(ASYNC_DB=True, EVENTS_BACKEND="memory")
+    init_async_db(flask_app)
+    init_events(flask_app)
+    asgi = AsyncApp(flask_app)
+
+    ### Anonymous requests are redirected or refused as usual
+    assert asgi_request(asgi, "GET", "/")[0] == 302
+    assert asgi_request(asgi, "GET", "/api/v1/tasks")[0] == 401
+
+    register(client, "test23", "password23")
+    login(client, "test23", "password23")
+    cookie = client.get_cookie("session").value
+    ids = client.post(
+        "/api/v1/tasks/bulk",
+        json={"tasks": [{"title": f"Async {i}"} for i in range(3)]},
+    ).get_json()["ids"]
+    client.delete(f"/api/v1/tasks/{ids[0]}")
+    client.get("/")  # shows the flash message and sets the counters up
+
+    ### JSON reads match the sync endpoints
+    reads = ("/api/v1/tasks?per_page=1", f"/api/v1/tasks/{ids[1]}", "/api/v1/summary")
+    for path in reads:
+        status, _, body = asgi_request(asgi, "GET", path, cookie)
+        assert status == 200
+        assert json.loads(body) == client.get(path).get_json()
+    assert asgi_request(asgi, "GET", f"/api/v1/tasks/{ids[0]}", cookie)[0] == 404
+
+    ### The task list and edit form keep their validators
+    status, headers, body = asgi_request(asgi, "GET", "/", cookie)
+    assert status == 200
+    assert b"Async 1" in body and b"Async 0" not in body
+    assert headers[b"etag"] == client.get("/").headers["ETag"].encode()
+    not_modified = asgi_request(
+        asgi, "GET", "/", cookie, [(b"if-none-match", headers[b"etag"])]
+    )
+    assert not_modified[0] == 304
+    assert asgi_request(asgi, "GET", f"/tasks/{ids[1]}/edit", cookie)[0] == 200
+    assert asgi_request(asgi, "GET", f"/tasks/{ids[0]}/edit", cookie)[0] == 404
+
+    ### Writes go through the WSGI app
+    status, _, body = asgi_request(
+        asgi, "POST", "/api/v1/tasks", cookie, body=b'{"title": "Via ASGI"}'
+    )
+    assert status == 201
+    assert json.loads(body)["title"] == "Via ASGI"
+
+    ### Event streams are served on the event loop, until the client leaves
+    assert b'data-events="/events"' in asgi_request(asgi, "GET", "/", cookie)[2]
+    flask_app.config.update(EVENTS_HEARTBEAT=0.05, EVENTS_STREAM_SECONDS=0.2)
+    status, headers, body = asgi_request(asgi, "GET", "/events", cookie)
+    assert status == 200
+    assert headers[b"content-type"].startswith(b"text/event-stream")
+    assert b"event: hello" in body and b": keepalive" in body
+    assert asgi_request(asgi, "GET", "/events")[0] == 401
+
+    flask_app.config["EVENTS_STREAM_SECONDS"] = 60
+    body = asgi_request(asgi, "GET", "/events", cookie, disconnect_after=0.2)[2]
+    assert b"event: hello" in body
+    assert not flask_app.extensions["task_events"]._subscribers
+
+### Twenty-first test : live task events
+### Function : sse_events
+def sse_events(text):
+    """
+    Function to parse a Server-Sent Events stream into (event, data) pairs.
+    """
+    events = []
+    for block in text.split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in block.splitlines() if ": " in line
+        )
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+### Function : test_task_event_stream
+def test_task_event_stream(flask_app, client):
+    """
+    Test that a user's event stream carries their task changes, rendered
+    and with the counters, and that fetch() submissions get a 204.
+    """
+    from events import init_events
+
+    flask_app.config.update(
+        EVENTS_BACKEND="memory", EVENTS_HEARTBEAT=0.05, EVENTS_STREAM_SECONDS=2
+    )
+    init_events(flask_app)
+
+    register(client, "test24", "password24")
+    login(client, "test24", "password24")
+    page = client.get("/").get_data(as_text=True)
+    version = re.search(r'data-version="(\w+)"', page).group(1)
+
+    ### The WSGI app only serves streams when told to
+    assert 'data-events=""' in page
+    assert client.get("/events").status_code == 404
+    flask_app.config["EVENTS_SYNC_STREAMS"] = True
+    assert 'data-events="/events"' in client.get("/").get_data(as_text=True)
+
+    ### The stream is read by another client (a browser tab) while this one edits
+    cookie = client.get_cookie("session").value
+    chunks, started = [], threading.Event()
+
+    def read_stream():
+        with flask_app.test_client() as tab:
+            tab.set_cookie("session", cookie)
+            stream = tab.get("/events")
+            assert stream.mimetype == "text/event-stream"
+            for chunk in stream.response:
+                chunks.append(chunk.decode())
+                started.set()
+
+    reader = threading.Thread(target=read_stream)
+    reader.start()
+    assert started.wait(5)
+
+    def received(count):
+        # Events are rendered from the task as it is when they are sent:
+        # wait for each one before the next change.
+        deadline = time.monotonic() + 5
+        while "".join(chunks).count("event: task") < count:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        return True
+
+    task_id = client.post(
+        "/api/v1/tasks", json={"title": "Live", "due_date": "2030-01-01"}
+    ).get_json()["id"]
+    fetch = {"X-Requested-With": "fetch"}
+    assert received(1)
+    assert client.post(f"/tasks/{task_id}/toggle", headers=fetch).status_code == 204
+    assert received(2)
+    assert client.post(f"/tasks/{task_id}/delete", headers=fetch).status_code == 204
+    assert received(3)
+    client.post("/api/v1/tasks/bulk", json={"tasks": [{"title": "Bulk"}]})
+    with client.session_transaction() as sess:
+        assert "_flashes" not in sess and "undo_task_id" not in sess
+    reader.join(5)
+
+    events = sse_events("".join(chunks))
+    assert events[0] == ("hello", {"version": version})
+    created, toggled, deleted, reset = (data for _, data in events[1:])
+    assert created["action"] == "upsert" and created["id"] == task_id
+    assert f'data-task-id="{task_id}"' in created["html"]
+    assert toggled["is_completed"] and toggled["summary"]["done"] == 1
+    assert deleted["action"] == "deleted" and deleted["summary"]["total"] == 0
+    assert reset["action"] == "reset" and reset["summary"]["total"] == 1
+    assert not flask_app.extensions["task_events"]._subscribers
+
+    ### The last event carries the version of a freshly rendered page
+    page = client.get("/").get_data(as_text=True)
+    assert f'data-version="{reset["version"]}"' in page
+
+### Twenty-second test : overdue filter
+### Function : test_overdue_filter
+def test_overdue_filter(client, query_budget):
+    """
+    Test that status=overdue lists the open tasks due before today, on the
+    page, in the API and in the export, within the index query budget.
+    """
+    register(client, "test25", "password25")
+    login(client, "test25", "password25")
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    ids = client.post(
+        "/api/v1/tasks/bulk",
+        json={
+            "tasks": [
+                {"title": "Late", "due_date": yesterday},
+                {"title": "Late but done", "due_date": yesterday},
+                {"title": "Soon", "due_date": tomorrow},
+                {"title": "Someday"},
+            ]
+        },
+    ).get_json()["ids"]
+    client.post("/api/v1/tasks/bulk-complete", json={"ids": [ids[1]]})
+
+    html = client.get("/?status=overdue").get_data(as_text=True)
+    assert "Late" in html and "Late but done" not in html
+    assert "Soon" not in html and "Someday" not in html
+    assert html.count('<span class="badge overdue">Overdue</span>') == 1
+
+    tasks = client.get("/api/v1/tasks?status=overdue").get_json()["tasks"]
+    assert [task["id"] for task in tasks] == [ids[0]]
+    export = client.get("/api/v1/tasks/export?status=overdue").get_data(as_text=True)
+    assert export.count("\n") == 1
+
+### Twenty-third test : background jobs
+### Function : test_job_worker_retries_schedules_and_sends_digests
+def test_job_worker_retries_schedules_and_sends_digests(
+    flask_app, client, monkeypatch, caplog
+):
+    """
+    Test that the worker runs queued jobs, retries failures until their last
+    attempt, enqueues each scheduled run once, and that the due-tomorrow
+    digest covers every user's open tasks across batches.
+    """
+    from jobs import HANDLERS, enqueue, requeue_stale_jobs, schedules
+    from reminders import send_due_digests
+
+    calls = []
+
+    def flaky(n):
+        calls.append(n)
+        if len(calls) == 1:
+            raise RuntimeError("try again")
+
+    def broken():
+        raise RuntimeError("always")
+
+    monkeypatch.setitem(HANDLERS, "test.flaky", flaky)
+    monkeypatch.setitem(HANDLERS, "test.broken", broken)
+    flask_app.config["JOB_RETRY_BACKOFF"] = 0
+    runner = flask_app.test_cli_runner()
+
+    ### Failures are retried, up to max_attempts
+    with flask_app.app_context():
+        flaky_id = enqueue("test.flaky", {"n": 1})
+        broken_id = enqueue("test.broken", max_attempts=2)
+        assert enqueue("test.flaky", {"n": 2}, key="once") is not None
+        assert enqueue("test.flaky", {"n": 3}, key="once") is None
+        db.session.commit()
+
+    result = runner.invoke(args=["jobs", "worker", "--once", "--no-schedule"])
+    assert result.exit_code == 0, result.output
+    assert sorted(calls) == [1, 1, 2]
+    with flask_app.app_context():
+        assert db.session.get(Job, flaky_id).status == "done"
+        broken_job = db.session.get(Job, broken_id)
+        assert (broken_job.status, broken_job.attempts) == ("failed", 2)
+        assert broken_job.last_error == "RuntimeError: always"
+
+        ### Jobs of a dead worker are given back
+        db.session.add(
+            Job(
+                name="test.flaky",
+                payload='{"n": 4}',
+                status="running",
+                attempts=1,
+                locked_by="gone:1",
+                locked_at=datetime(2020, 1, 1),
+            )
+        )
+        db.session.commit()
+        assert requeue_stale_jobs(timedelta(minutes=15)) == 1
+
+    ### Scheduled jobs are enqueued once per period
+    result = runner.invoke(args=["jobs", "worker", "--once"])
+    assert result.exit_code == 0, result.output
+    # Each scheduled job, plus the one given back.
+    assert f"Ran {len(schedules(flask_app)) + 1} jobs." in result.output
+    result = runner.invoke(args=["jobs", "worker", "--once"])
+    assert "Ran 0 jobs." in result.output
+    with flask_app.app_context():
+        names = db.session.scalars(
+            select(Job.name).where(Job.key.is_not(None), Job.status == "done")
+        ).all()
+        assert {"tasks.digest", "tasks.purge", "jobs.cleanup"} <= set(names)
+
+    ### The digest reads the tasks due tomorrow in batches
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    for user in ("test26", "test27"):
+        register(client, user, "password26")
+        login(client, user, "password26")
+        client.post(
+            "/api/v1/tasks/bulk",
+            json={
+                "tasks": [
+                    {"title": f"{user} a", "due_date": tomorrow},
+                    {"title": f"{user} b", "due_date": tomorrow},
+                    {"title": f"{user} later"},
+                ]
+            },
+        )
+    caplog.set_level("INFO", logger="reminders")
+    with flask_app.app_context():
+        day = date.today() + timedelta(days=1)
+        assert send_due_digests(day, batch_size=1) == 2
+    digests = [r.getMessage() for r in caplog.records if r.name == "reminders"]
+    assert len(digests) == 2
+    assert "2 task(s)" in digests[0] and "test26 a, test26 b" in digests[0]
+
+### Twenty-fourth test : read replicas
+### Function : test_reads_go_to_replicas
+def test_reads_go_to_replicas(monkeypatch, tmp_path):
+    """
+    Test that GET requests read from a replica, except right after a write
+    of the same session, and fall back to the primary when a replica fails.
+    """
+    ### One replica on the primary's file, one that can't be opened
+    primary_url = f"sqlite:///{tmp_path / 'primary.db'}"
+    monkeypatch.setenv("DATABASE_URL", primary_url)
+    monkeypatch.setenv(
+        "DATABASE_REPLICA_URLS",
+        f"{primary_url}, sqlite:///{tmp_path / 'missing' / 'replica.db'}",
+    )
+    app = create_app()
+    app.config.update(TESTING=True, REPLICA_STICKY_SECONDS=60)
+    # Nothing of the replicas is left on the shared db for later apps.
+    assert list(db.metadatas) == [None]
+    statements = {}
+    with app.app_context():
+        db.create_all()
+        engines = {None: db.engine, **app.extensions["replicas"].engines}
+        for key, engine in engines.items():
+            event.listen(
+                engine,
+                "before_cursor_execute",
+                lambda *args, key=key: statements.setdefault(key, []).append(args[2]),
+            )
+
+    client = app.test_client()
+    register(client, "test28", "password28")
+
+    ### Requests that wrote nothing for a user don't pin the session
+    login(client, "test28", "wrong")
+    with client.session_transaction() as sess:
+        assert "primary_until" not in sess
+    login(client, "test28", "password28")
+    client.post("/tasks/new", data={"title": "Replicated"})
+
+    ### Right after a write, the session reads its own writes on the primary
+    statements.clear()
+    assert b"Replicated" in client.get("/").data
+    assert set(statements) == {None}
+
+    ### Later on, reads go to the healthy replica
+    app.config["REPLICA_STICKY_SECONDS"] = 0
+    client.post("/tasks/new", data={"title": "Second"})
+    for _ in range(3):
+        statements.clear()
+        response = client.get("/")
+        assert response.status_code == 200
+        assert b"Second" in response.data
+    # Only the server-side session store, if any, still uses the primary.
+    assert not [sql for sql in statements.get(None, []) if "tasks" in sql]
+    assert all(sql.lstrip().startswith("SELECT") for sql in statements["replica_0"])
+    assert not app.extensions["replicas"].is_up("replica_1")
+
+    ### A failing statement doesn't take a healthy replica out
+    with app.app_context():
+        with pytest.raises(OperationalError):
+            with app.extensions["replicas"].engines["replica_0"].connect() as conn:
+                conn.exec_driver_sql("SELECT * FROM no_such_table")
+    assert app.extensions["replicas"].is_up("replica_0")
+
+    for engine in engines.values():
+        engine.dispose()
+
+### Twenty-fifth test : sign-in rate limits
+### Function : test_sign_in_attempts_are_rate_limited
+@pytest.mark.parametrize("backend", ["memory", "sql"])
+def test_sign_in_attempts_are_rate_limited(flask_app, client, monkeypatch, backend):
+    """
+    Test that login attempts are limited per username and per client address,
+    refused with a 429 before the user is looked up or a password hashed,
+    and counted on /metrics.
+    """
+    import app as app_module
+
+    flask_app.config.update(
+        RATE_LIMIT_BACKEND=backend,
+        RATE_LIMIT_PER_IP="4/60",
+        RATE_LIMIT_PER_USERNAME="2/60",
+    )
+    init_rate_limits(flask_app)
+    register(client, "test29", "password29")
+
+    ### Two attempts per username
+    assert b"Invalid username" in login(client, "test29", "wrong").data
+    assert login(client, "test29", "password29").status_code == 200
+
+    statements = []
+    with flask_app.app_context():
+        event.listen(
+            db.engine,
+            "before_cursor_execute",
+            lambda *args: statements.append(args[2]),
+        )
+
+    def no_hashing(*args):
+        raise AssertionError("password checked")
+
+    monkeypatch.setattr(app_module, "verify_password", no_hashing)
+    response = login(client, "TEST29", "password29")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert not [sql for sql in statements if "users" in sql]
+
+    ### Four per address, whatever the username
+    monkeypatch.undo()
+    assert login(client, "test30", "password30").status_code == 200
+    assert login(client, "test31", "password31").status_code == 429
+    # Registration has buckets of its own.
+    assert register(client, "test32", "password32").status_code == 200
+
+    ### Counters
+    metrics = client.get("/metrics").get_data(as_text=True)
+    for line in (
+        'rate_limit_requests_total{endpoint="login",bucket="all",outcome="allowed"} 3',
+        'rate_limit_requests_total{endpoint="login",bucket="ip",outcome="limited"} 1',
+    ):
+        assert line in metrics
+    assert 'bucket="username",outcome="limited"} 1' in metrics
+    if backend == "sql":
+        with flask_app.app_context():
+            assert db.session.query(RateLimitBucket).count() == 6
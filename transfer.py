@@ -0,0 +1,195 @@
+# transfer.py
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass, field
+
+from counters import apply_task_changes
+from extensions import db
+from models import Task
+from sqlalchemy import insert
+from validation import TaskValidationError, parse_task_fields
+
+FORMATS = ("csv", "jsonl")
+MIMETYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+EXPORT_COLUMNS = (
+    "id",
+    "title",
+    "description",
+    "due_date",
+    "is_completed",
+    "created_at",
+)
+
+# Only the first errors are listed; error_count still counts all of them.
+MAX_REPORTED_ERRORS = 100
+
+_TRUE, _FALSE = {"1", "true", "yes"}, {"", "0", "false", "no"}
+
+
+class TaskImportError(ValueError):
+    """Raised when an import can't start at all (unknown format, bad header)."""
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+
+def detect_format(filename: str | None, mimetype: str | None) -> str:
+    """
+    "csv" or "jsonl" from a file extension or a Content-Type.
+    """
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv" or mimetype == "text/csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson") or mimetype in (
+        "application/x-ndjson",
+        "application/jsonl",
+    ):
+        return "jsonl"
+    raise TaskImportError("Unknown file format; use format=csv or format=jsonl.")
+
+
+def _csv_rows(text):
+    reader = csv.DictReader(text)
+    if "title" not in (reader.fieldnames or []):
+        raise TaskImportError("The CSV header must have a 'title' column.")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _jsonl_rows(text):
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, TaskValidationError("Invalid JSON.")
+
+
+def _completed(value) -> bool:
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE | _FALSE:
+        return value.strip().lower() in _TRUE
+    raise TaskValidationError("is_completed must be true or false.")
+
+
+def _row_fields(item) -> dict:
+    if isinstance(item, TaskValidationError):
+        raise item
+    if not isinstance(item, dict):
+        raise TaskValidationError("Expected a JSON object.")
+    fields = parse_task_fields(
+        item.get("title"), item.get("description"), item.get("due_date")
+    )
+    fields["is_completed"] = _completed(item.get("is_completed"))
+    return fields
+
+
+def _insert_batch(user_id: int, rows: list) -> None:
+    # One executemany, batched into multi-row INSERTs by SQLAlchemy.
+    db.session.execute(insert(Task), rows)
+    apply_task_changes(
+        user_id, [(None, (row["is_completed"], row["due_date"])) for row in rows]
+    )
+    db.session.commit()
+
+
+def import_tasks(
+    user_id: int, stream, fmt: str, batch_size: int = 1000, max_rows: int = 0
+) -> ImportResult:
+    """
+    Add the tasks of a CSV or JSONL byte stream to the user's tasks.
+
+    The stream is parsed as it is read and valid rows are inserted in batches
+    of `batch_size`, each in its own transaction, so memory stays flat
+    whatever the file size. Invalid rows are skipped and reported by line
+    with the create_task messages. Reading stops after `max_rows` rows when
+    set; rows of batches already committed stay imported.
+    """
+    if fmt not in FORMATS:
+        raise TaskImportError("Unknown file format; use format=csv or format=jsonl.")
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    rows = _csv_rows(text) if fmt == "csv" else _jsonl_rows(text)
+    result, batch, seen, line_no = ImportResult(), [], 0, 0
+    try:
+        for line_no, item in rows:
+            seen += 1
+            if max_rows and seen > max_rows:
+                result.add_error(line_no, f"Stopped after {max_rows} rows.")
+                break
+            try:
+                fields = _row_fields(item)
+            except TaskValidationError as exc:
+                result.add_error(line_no, str(exc))
+                continue
+            batch.append({**fields, "user_id": user_id})
+            if len(batch) >= batch_size:
+                _insert_batch(user_id, batch)
+                result.imported += len(batch)
+                batch = []
+    except UnicodeDecodeError:
+        # The rest of the file can't be read reliably: keep what came before.
+        result.add_error(line_no + 1, "File is not valid UTF-8.")
+    except csv.Error as exc:
+        result.add_error(line_no + 1, f"Malformed CSV: {exc}")
+
+    if batch:
+        _insert_batch(user_id, batch)
+        result.imported += len(batch)
+    return result
+
+
+def _export_value(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def export_tasks(
+    user_id: int, fmt: str, status_filter: str = "all", batch_size: int = 1000
+):
+    """
+    Yield the user's tasks as CSV or JSONL text, one chunk per `batch_size`
+    rows. Rows come from a server-side cursor (yield_per), so neither the
+    database driver nor this generator ever holds the whole list.
+    """
+    query = (
+        Task.query_for(user_id, status_filter)
+        .with_entities(*(getattr(Task, name) for name in EXPORT_COLUMNS))
+        .order_by(Task.id)
+        .yield_per(batch_size)
+    )
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+
+    pending = 0
+    for row in query:
+        values = [_export_value(value) for value in row]
+        if writer is not None:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))) + "\n")
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,44 @@
+# validation.py
+from datetime import datetime
+
+TITLE_MAX_LENGTH = 255  # tasks.title is a VARCHAR(255)
+
+
+class TaskValidationError(ValueError):
+    """Raised with a user-facing message when task input is rejected."""
+
+
+def _text(value, field: str) -> str:
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise TaskValidationError(f"{field} must be a string.")
+    return value.strip()
+
+
+def parse_task_fields(title, description, due_date) -> dict:
+    """
+    Validate raw task input (form or JSON) and return the column values.
+
+    The rules are the ones create_task and edit_task have always applied:
+    a non-empty title that fits the column and an optional YYYY-MM-DD due date.
+    """
+    title = _text(title, "Title")
+    description = _text(description, "Description")
+    due_date_str = _text(due_date, "Due date")
+
+    if not title:
+        raise TaskValidationError("Title is required.")
+    if len(title) > TITLE_MAX_LENGTH:
+        raise TaskValidationError(
+            f"Title must be at most {TITLE_MAX_LENGTH} characters."
+        )
+
+    parsed_due = None
+    if due_date_str:
+        try:
+            parsed_due = datetime.strptime(due_date_str, "%Y-%m-%d").date()
+        except ValueError:
+            raise TaskValidationError("Invalid date format. Use YYYY-MM-DD.") from None
+
+    return {"title": title, "description": description or None, "due_date": parsed_due}